@@ -0,0 +1,185 @@
+""" Compression of the audio exchanged with clients and ASRs """
+
+import distutils.spawn
+import logging
+import metrics
+import os
+import subprocess
+import threading
+
+try:
+	from gevent import monkey
+except ImportError:
+	monkey = None
+
+logger = logging.getLogger(__name__)
+
+# encodings each backend accepts besides raw LINEAR16
+SUPPORTED = {
+	'google': ['LINEAR16', 'FLAC'],
+	'ibm': ['LINEAR16', 'FLAC', 'OGG_OPUS'],
+	'hound': ['LINEAR16', 'SPEEX'],
+}
+
+# external encoders reading interleaved 16-bit PCM on stdin, writing a stream on stdout
+_ENCODERS = {
+	'FLAC': lambda rate, channels=1: ['flac', '--silent', '--force-raw-format',
+		'--endian=little', '--sign=signed', '--channels=%d' % channels, '--bps=16',
+		'--sample-rate=%d' % rate, '--blocksize=1152', '--stdout', '-'],
+	'OGG_OPUS': lambda rate, channels=1: ['opusenc', '--quiet', '--raw', '--raw-bits=16',
+		'--raw-rate=%d' % rate, '--raw-chan=%d' % channels, '--speech', '--max-delay=100',
+		'-', '-'],
+}
+
+# and the decoders back to 16-bit PCM
+_DECODERS = {
+	'FLAC': lambda rate: ['flac', '--silent', '--decode', '--force-raw-format',
+		'--endian=little', '--sign=signed', '--stdout', '-'],
+	'OGG_OPUS': lambda rate: ['opusdec', '--quiet', '--rate', str(rate), '-', '-'],
+}
+
+_READ_SIZE = 64*1024
+
+# under stt_server_gevent a blocking read would stall the event loop:
+# the output is read non-blocking, waiting on the hub
+_GEVENT = monkey is not None and monkey.is_module_patched('os')
+if _GEVENT:
+	import gevent.os
+	_read = gevent.os.nb_read
+else:
+	_read = os.read
+
+_CPU = metrics.histogram('stt_codec_cpu_per_audio_second',
+	'CPU seconds of an encoder or decoder process per second of audio',
+	['encoding', 'direction'], buckets=(0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0))
+
+
+def _cpu_seconds(pid):
+	''' User and system CPU time of a child process not reaped yet, None
+		if it cannot be read
+	'''
+	try:
+		with open('/proc/%d/stat' % pid) as f:
+			fields = f.read().rsplit(')', 1)[1].split()
+	except (EnvironmentError, IndexError):
+		return None
+	return (int(fields[11]) + int(fields[12]))/float(os.sysconf('SC_CLK_TCK'))
+
+
+def _installed(command):
+	return distutils.spawn.find_executable(command(16000)[0]) is not None
+
+
+def available(encoding):
+	''' True if audio can be sent to an asr in encoding '''
+	if encoding == 'LINEAR16':
+		return True
+	if encoding == 'SPEEX':
+		# encoded frame by frame inside the hound client
+		try:
+			import pySHSpeex
+			return True
+		except ImportError:
+			return False
+	return _installed(_ENCODERS[encoding])
+
+
+def decodable(encoding):
+	''' True if audio from clients can be received in encoding '''
+	return encoding == 'LINEAR16' or (encoding in _DECODERS and _installed(_DECODERS[encoding]))
+
+
+def external(encoding):
+	''' True if encoding is produced by encode() '''
+	return encoding in _ENCODERS
+
+
+def encode(chunks, encoding, rate=16000, channels=1):
+	''' Iterator over chunks of PCM with `channels` interleaved channels
+		encoded to encoding
+	'''
+	return PipeStream(chunks, _ENCODERS[encoding](rate, channels), encoding, 'encode',
+		rate, channels)
+
+
+def decode(chunks, encoding, rate=16000, channels=1):
+	''' Iterator over the PCM of chunks of encoded audio, in whole samples '''
+	return PipeStream(chunks, _DECODERS[encoding](rate), encoding, 'decode', rate, channels)
+
+
+class PipeStream:
+	''' Iterator over the output of an encoder or decoder process fed
+		with chunks. The coding runs in the child process, so it takes
+		no time from the session threads: a feeder thread only copies
+		chunks into its stdin and next() returns whatever output is
+		ready. The stream ends once the input ends and the process has
+		flushed; its CPU time per second of audio is then recorded.
+	'''
+
+	def __init__(self, chunks, command, encoding, direction, rate=16000, channels=1):
+		self.chunks = chunks
+		self.encoding = encoding
+		self.direction = direction
+		self.rate = rate
+		self.channels = channels
+		self.pcm_bytes = 0
+		self.leftover = ''
+		self.proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+			stdout=subprocess.PIPE, close_fds=True)
+		if _GEVENT:
+			gevent.os.make_nonblocking(self.proc.stdout.fileno())
+		self.feeder = threading.Thread(target=self._feed)
+		self.feeder.daemon = True
+		self.feeder.start()
+
+	def _feed(self):
+		try:
+			for chunk in self.chunks:
+				if self.direction == 'encode':
+					self.pcm_bytes += len(chunk)
+				self.proc.stdin.write(chunk)
+				self.proc.stdin.flush()
+		except EnvironmentError as e:
+			logger.error('Audio %sr input closed: %s', self.direction, e)
+		finally:
+			try:
+				self.proc.stdin.close()
+			except EnvironmentError:
+				pass
+
+	def __iter__(self):
+		return self
+
+	def next(self):
+		while True:
+			data = _read(self.proc.stdout.fileno(), _READ_SIZE)
+			if not data:
+				self._reap()
+				raise StopIteration
+			if self.direction == 'encode':
+				return data
+
+			# decoded PCM is handed on in whole 16-bit samples
+			self.pcm_bytes += len(data)
+			data = self.leftover + data
+			end = len(data) & ~1
+			self.leftover = data[end:]
+			if end:
+				return data[:end]
+
+	def _reap(self):
+		# read before wait(): the time of a reaped process is gone
+		cpu = _cpu_seconds(self.proc.pid)
+		self.proc.wait()
+		audio_seconds = self.pcm_bytes/(2.0*self.rate*self.channels)
+		if audio_seconds and cpu is not None:
+			_CPU.labels(self.encoding, self.direction).observe(cpu/audio_seconds)
+
+	def close(self):
+		''' Stop coding; the input iterator is closed as well '''
+		close = getattr(self.chunks, 'close', None)
+		if close is not None:
+			close()
+		if self.proc.returncode is None:
+			self.proc.kill()
+			self._reap()
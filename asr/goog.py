@@ -7,10 +7,17 @@ from google.cloud import speech as cloud_speech
 from google.cloud.speech import enums
 from google.cloud.speech import types
 
+from google.gax.errors import GaxError
 from google.rpc import code_pb2
+import google.auth
+import google.auth.transport.grpc
+import google.auth.transport.requests
+import grpc
+import threading
 import time, random
 import argparse
 import utils, sys
+import metrics
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,12 +25,202 @@ logger = logging.getLogger(__name__)
 # Audio recording parameters
 RATE = 16000
 
+# errors after which a pooled client is not reused
+_TRANSPORT_ERRORS = (GaxError, grpc.RpcError)
+
+_CONNECT_SECONDS = metrics.histogram('stt_asr_connect_seconds',
+	'Time to open a backend stream', ['asr']).labels('google')
+_ERRORS = metrics.counter('stt_asr_errors_total',
+	'Backend streams that ended in an error', ['asr']).labels('google')
+
+
+def _secure_channel(service_path=None, port=None):
+	''' A TLS channel to the speech service (or service_path:port),
+		authorized with the application default credentials, as
+		SpeechClient opens it
+	'''
+	client = cloud_speech.SpeechClient
+	credentials, _ = google.auth.default(scopes=client._ALL_SCOPES)
+	return google.auth.transport.grpc.secure_authorized_channel(credentials,
+		google.auth.transport.requests.Request(),
+		'%s:%d' % (service_path or client.SERVICE_ADDRESS, port or client.DEFAULT_SERVICE_PORT))
+
+
+def _close(channel):
+	# grpcio before 1.12 has no close() and frees channels when collected
+	if channel is not None and hasattr(channel, 'close'):
+		channel.close()
+
+
+class ClientPool:
+	''' Process-wide pool of long-lived SpeechClient objects. Creating a
+		client loads credentials and opens a TLS channel, so clients are
+		kept and shared: a gRPC channel multiplexes concurrent streams,
+		and a client takes up to `streams` sessions before another one
+		is opened (at most `size` clients). Clients that hit a transport
+		error are discarded and clients idle for `idle` seconds are
+		evicted. With size 0 every utterance gets a fresh client.
+
+		A client that leaves the pool, or never was in it, has its
+		channel closed once its last stream is released. A channel
+		passed in client_args is left open; the others go to the
+		service_path and port in client_args, if given.
+	'''
+
+	def __init__(self, size=4, streams=50, idle=300, **client_args):
+		self.size = size
+		self.streams = streams
+		self.idle = idle
+		self.client_args = client_args
+		self.lock = threading.Lock()
+		self.clients = {} # client -> [active streams, last used]
+		self.opening = 0 # pool slots reserved for clients being created
+		self.unpooled = {} # client -> active streams, closed at 0
+		self.channels = {} # client -> channel opened for it
+
+	def configure(self, size=None, streams=None, idle=None, **client_args):
+		closing = []
+		with self.lock:
+			if size is not None:
+				self.size = size
+			if streams is not None:
+				self.streams = streams
+			if idle is not None:
+				self.idle = idle
+			if client_args:
+				self.client_args = client_args
+				closing = self._unpool(self.clients.keys())
+		for channel in closing:
+			_close(channel)
+
+	def _new_client(self):
+		if 'channel' in self.client_args:
+			return cloud_speech.SpeechClient(**self.client_args)
+		args = dict(self.client_args)
+		channel = _secure_channel(args.pop('service_path', None), args.pop('port', None))
+		try:
+			client = cloud_speech.SpeechClient(channel=channel, **args)
+		except:
+			_close(channel)
+			raise
+		with self.lock:
+			self.channels[client] = channel
+		return client
+
+	def _unpool(self, clients):
+		''' Take clients out of the pool (with the lock held); returns the
+			channels to close now, those of the clients without streams
+		'''
+		closing = []
+		for client in clients:
+			active = self.clients.pop(client)[0]
+			if active:
+				self.unpooled[client] = active
+			else:
+				closing.append(self.channels.pop(client, None))
+		return closing
+
+	def _reserve(self):
+		''' A pool slot for a new client, if one is free (lock held) '''
+		if len(self.clients) + self.opening < self.size:
+			self.opening += 1
+			return True
+		return False
+
+	def _add(self, client, active, now):
+		with self.lock:
+			self.opening -= 1
+			if client is not None:
+				self.clients[client] = [active, now]
+
+	def warm(self, count=1):
+		''' Open clients ahead of the first session '''
+		for _ in range(count):
+			with self.lock:
+				if not self._reserve():
+					return
+			client = None
+			try:
+				client = self._new_client()
+			finally:
+				self._add(client, 0, time.time())
+
+	def _evict_idle(self, now):
+		idle = [client for client, (active, last_used) in self.clients.items()
+			if active == 0 and now - last_used > self.idle]
+		return self._unpool(idle)
+
+	def acquire(self):
+		now = time.time()
+		with self.lock:
+			closing = self._evict_idle(now)
+			client = None
+			if self.clients:
+				client = min(self.clients, key=lambda c: self.clients[c][0])
+				state = self.clients[client]
+				if state[0] < self.streams or len(self.clients) + self.opening >= self.size:
+					state[0] += 1
+					state[1] = now
+				else:
+					client = None
+			pooled = client is None and self._reserve()
+		for channel in closing:
+			_close(channel)
+		if client is not None:
+			return client
+
+		if not pooled:
+			client = self._new_client()
+			with self.lock:
+				self.unpooled[client] = 1
+			return client
+		try:
+			client = self._new_client()
+		finally:
+			self._add(client, 1, now)
+		return client
+
+	def release(self, client, healthy=True):
+		channel = None
+		with self.lock:
+			state = self.clients.get(client)
+			if state is not None:
+				state[0] -= 1
+				state[1] = time.time()
+				if not healthy:
+					logger.info('Discarding google client after transport error')
+					closing = self._unpool([client])
+					channel = closing[0] if closing else None
+			elif client in self.unpooled:
+				self.unpooled[client] -= 1
+				if self.unpooled[client] == 0:
+					del self.unpooled[client]
+					channel = self.channels.pop(client, None)
+		_close(channel)
+
+	def stats(self):
+		with self.lock:
+			return {'clients': len(self.clients),
+				'streams': sum(s[0] for s in self.clients.values())}
+
+
+pool = ClientPool()
+
 
 class worker:
 
 	def __init__(self, token):
 		self.got_end_audio = False
 		self.token = token
+		self.cancelled = False
+		self.responses = None
+
+	def cancel(self):
+		''' Abort the stream; the final with the transcript so far still follows '''
+		self.cancelled = True
+		self.got_end_audio = True
+		if self.responses is not None:
+			self.responses.cancel()
 
 
 	def request_stream(self, chunkIterator):
@@ -42,13 +239,17 @@ class worker:
 		last_transcript = ''
 		last_confidence = -1
 		continuous_transcript = [''] # list of multiple is_final sub-transcripts
+		healthy = True
+		service = None
+		stream_start = time.time()
 		try:
-			service = cloud_speech.SpeechClient()
-			logger.info("%s: Initialized", self.token)
+			service = pool.acquire()
+			_CONNECT_SECONDS.observe(time.time() - stream_start)
+			logger.info("%s: Initialized in %.1f ms", self.token, 1000*(time.time() - stream_start))
 
 			recognition_config = types.RecognitionConfig(
-				# encoding=config['encoding'],
-				encoding=enums.RecognitionConfig.AudioEncoding.LINEAR16,
+				# LINEAR16, or FLAC when the server compresses the upstream audio
+				encoding=getattr(enums.RecognitionConfig.AudioEncoding, config['encoding']),
 				sample_rate_hertz=config['sampling_rate'],
 				max_alternatives=config['max_alternatives'],
 				language_code=config['language'],
@@ -59,12 +260,21 @@ class worker:
 				single_utterance=not (config['continuous']))
 
 			responses = service.streaming_recognize(streaming_config, self.request_stream(chunkIterator))
+			self.responses = responses
+			if self.cancelled:
+				responses.cancel()
 
 			# putting a timer on responses rather than speech
 			start_time = time.time()
+			first_response = True
 
 			for response in responses:
 
+				if first_response:
+					logger.info("%s: first response after %.1f ms", self.token,
+						1000*(time.time() - stream_start))
+					first_response = False
+
 				# logger.info(response)
 				# print response, response.speech_event_type
 				curr_time = time.time()
@@ -106,9 +316,16 @@ class worker:
 
 		except:
 			e = sys.exc_info()[0]
-			logger.error('%s: %s connection error', self.token, e)
+			if self.cancelled:
+				logger.info('%s: cancelled', self.token)
+			else:
+				logger.error('%s: %s connection error', self.token, e)
+				_ERRORS.inc()
+				healthy = not issubclass(e, _TRANSPORT_ERRORS)
 
 		finally:
+			if service is not None:
+				pool.release(service, healthy)
 			yield {'transcript' : (''.join(continuous_transcript) if config['continuous'] else last_transcript),
 					'is_final': True,
 					'confidence': last_confidence}
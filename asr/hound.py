@@ -2,6 +2,7 @@
 
 """ Interface for Hound Speech to Text ASR"""
 
+import base64
 import wave
 import houndify
 import sys
@@ -9,11 +10,27 @@ import json
 import Queue
 import argparse
 import thread, threading
+import keycache
+import metrics
+import time
 import utils
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# audio held back to coalesce 20ms frames into one HTTP chunk
+COALESCE_MS = 100
+
+# endpoint (fakes.start points it at a local stand-in)
+HOSTNAME = houndify.HOUND_SERVER
+USE_HTTPS = True
+KEY_FILE = "asr/hound_key.json"
+
+_CONNECT_SECONDS = metrics.histogram('stt_asr_connect_seconds',
+    'Time to open a backend stream', ['asr']).labels('hound')
+_ERRORS = metrics.counter('stt_asr_errors_total',
+    'Backend streams that ended in an error', ['asr']).labels('hound')
+
 class ResponseListener(houndify.HoundListener):
     def __init__(self, responseQueue):
         self.responseQueue = responseQueue
@@ -30,14 +47,16 @@ class ResponseListener(houndify.HoundListener):
         print "Hound ERROR"
 
 
-def credentials():
-    with open("asr/hound_key.json") as f:
-        creds_json = json.load(f)
+def _prepare_credentials(creds_json):
     creds = {}
     creds['CLIENT_ID'] = str(creds_json["ClientID"])
     creds['CLIENT_KEY'] = str(creds_json["ClientKey"])
+    creds['DECODED_CLIENT_KEY'] = base64.urlsafe_b64decode(creds['CLIENT_KEY'])
     return creds
 
+def credentials():
+    return keycache.cache.get(KEY_FILE, _prepare_credentials)
+
 # TODO: Move everything under a single class
 def request_stream(client, chunkIterator, responseQueue):
     try:
@@ -56,7 +75,16 @@ class worker:
 
     def __init__(self, token):
         self.token = token
+        self.cancelled = False
+        self.client = None
+        self.responseQueue = Queue.Queue()
 
+    def cancel(self):
+        ''' Abort the request; the final with the transcript so far still follows '''
+        self.cancelled = True
+        self.responseQueue.put('EOS')
+        if self.client is not None:
+            self.client.cancel()
 
     def stream(self, chunkIterator, config=None):
 
@@ -64,12 +92,21 @@ class worker:
         try:
             creds = credentials()
             client = houndify.StreamingHoundClient(creds['CLIENT_ID'], creds['CLIENT_KEY'],
-                "asr_user")
+                "asr_user", decodeFinalResponse=False,
+                decodedClientKey=creds['DECODED_CLIENT_KEY'],
+                hostname=HOSTNAME, useHttps=USE_HTTPS,
+                useSpeex=(config or {}).get('encoding') == 'SPEEX')
             client.setSampleRate(16000)
+            client.setCoalesceMs(COALESCE_MS)
             client.setLocation(37.388309, -121.973968)
 
-            responseQueue = Queue.Queue()
+            responseQueue = self.responseQueue
+            start = time.time()
             client.start(ResponseListener(responseQueue))
+            _CONNECT_SECONDS.observe(time.time() - start)
+            self.client = client
+            if self.cancelled:
+                client.cancel()
             logger.info("%s: Initialized", self.token)
             t = threading.Thread(target=request_stream, args=(client, chunkIterator, responseQueue))
             t.start()
@@ -82,8 +119,10 @@ class worker:
         except:
             e = sys.exc_info()[0]
             logger.error('%s: %s connection error', self.token, e)
+            if not self.cancelled:
+                _ERRORS.inc()
         finally:
-            yield {'transcript' : last_transcript, 'is_final': True, 'confidence': 1}
+            yield {'transcript' : last_transcript, 'is_final': True, 'confidence': -1}
             logger.info('%s: finished', self.token)
             t.join()
 
@@ -6,6 +6,8 @@ import hashlib
 import hmac
 import httplib
 import json
+import re
+import socket
 import threading
 import time
 import uuid
@@ -23,6 +25,11 @@ TEXT_ENDPOINT = "/v1/text"
 VOICE_ENDPOINT = "/v1/audio"
 VERSION = '0.3.0'
 
+PARTIAL_FORMAT = '"SoundHoundVoiceSearchParialTranscript"'
+RESULT_FORMAT = '"SoundHoundVoiceSearchResult"'
+_PARTIAL_TRANSCRIPT = re.compile(r'"PartialTranscript"\s*:\s*("(?:[^"\\]|\\.)*")')
+_SAFE_TO_STOP = re.compile(r'"SafeToStopAudio"\s*:\s*true')
+
 
 class _BaseHoundClient:
 
@@ -118,17 +125,31 @@ class StreamingHoundClient(_BaseHoundClient):
     StreamingHoundClient is used to send streaming audio to the Hound
     server and receive live transcriptions back
     """
-    def __init__(self, clientID, clientKey, userID, requestInfo = dict(), hostname = HOUND_SERVER, sampleRate = 16000, useSpeex = False):
+    def __init__(self, clientID, clientKey, userID, requestInfo = dict(), hostname = HOUND_SERVER, sampleRate = 16000, useSpeex = False, coalesceMs = 100, decodeFinalResponse = True, decodedClientKey = None, useHttps = True):
       """
       clientID and clientKey are "Client ID" and "Client Key" 
       from the Houndify.com web site.
+
+      coalesceMs is the audio latency budget: PCM frames are held back until
+      that much audio is buffered and then sent as one HTTP chunk.
+
+      With decodeFinalResponse False the final SoundHoundVoiceSearchResult is
+      passed to onFinalResponse as the undecoded JSON string.
+
+      decodedClientKey is the already base64-decoded clientKey, for callers
+      that cache it. useHttps False talks plain HTTP (local test servers).
       """
-      self.clientKey = base64.urlsafe_b64decode(clientKey)
+      if decodedClientKey is None:
+        decodedClientKey = base64.urlsafe_b64decode(clientKey)
+      self.clientKey = decodedClientKey
       self.clientID = clientID
       self.userID = userID
       self.hostname = hostname
       self.sampleRate = sampleRate
       self.useSpeex = useSpeex
+      self.coalesceMs = coalesceMs
+      self.decodeFinalResponse = decodeFinalResponse
+      self.useHttps = useHttps
 
       self.HoundRequestInfo = {
         'ClientID': clientID,
@@ -153,6 +174,14 @@ class StreamingHoundClient(_BaseHoundClient):
         raise Exception("Unsupported sample rate")
 
 
+    def setCoalesceMs(self, coalesceMs):
+      """
+      Set how many milliseconds of PCM audio are coalesced into one HTTP chunk.
+      0 sends the complete frames of every fill() call right away.
+      """
+      self.coalesceMs = coalesceMs
+
+
     def start(self, listener):
       """
       This method is used to make the actual connection to the server and prepare
@@ -161,9 +190,12 @@ class StreamingHoundClient(_BaseHoundClient):
       listener is a HoundListener (or derived class) object
       """
       self.audioFinished = False
-      self.buffer = ''
+      self.buffer = bytearray()
     
-      self.conn = httplib.HTTPSConnection(self.hostname)
+      if self.useHttps:
+        self.conn = httplib.HTTPSConnection(self.hostname)
+      else:
+        self.conn = httplib.HTTPConnection(self.hostname)
       self.conn.putrequest('POST', VOICE_ENDPOINT)
 
       headers = self._generateHeaders(self.HoundRequestInfo)
@@ -195,20 +227,34 @@ class StreamingHoundClient(_BaseHoundClient):
         # buffer gets flushed on next call to start()
         return True
 
-      self.buffer += data
-      
+      self.buffer.extend(data)
+      self._flush(self.coalesceMs)
+
+      return False
+
+
+    def _flush(self, coalesceMs):
+      """
+      Send the complete 20ms frames in the buffer once at least coalesceMs of
+      audio is waiting
+      """
       # 20ms 16-bit audio frame = (2 * 0.02 * sampleRate) bytes
       frame_size = int(2 * 0.02 * self.sampleRate)
-      while len(self.buffer) > frame_size:
-        frame = self.buffer[:frame_size]
-        if self.useSpeex:
-          frame = pySHSpeex.EncodeFrame(frame)
-
-        self._send(frame)
+      ready = len(self.buffer) - len(self.buffer) % frame_size
+      if ready == 0 or (not self.useSpeex and ready < 2 * self.sampleRate * coalesceMs // 1000):
+        return
 
-        self.buffer = self.buffer[frame_size:]
+      view = memoryview(self.buffer)
+      if self.useSpeex:
+        # speex frames keep one HTTP chunk each, written with a single send
+        self._send(*[pySHSpeex.EncodeFrame(view[i:i + frame_size].tobytes())
+          for i in xrange(0, ready, frame_size)])
+      else:
+        self._send(view[:ready])
 
-      return False
+      # the view must be gone before the buffer can shrink
+      del view
+      del self.buffer[:ready]
 
 
     def finish(self):
@@ -219,48 +265,78 @@ class StreamingHoundClient(_BaseHoundClient):
       After finish() is called, you can start another request with start() but each
       start() call should have a corresponding finish() to wait for the threads
       """
+      if not self.audioFinished:
+        self._flush(0)
       self._send(json.dumps({'endOfAudio': True}))
       self._send('')
 
       self.callbackTID.join()
 
 
+    def cancel(self):
+      """
+      Abort the request from another thread: shuts the connection down so
+      the response thread and any pending send return
+      """
+      if self.conn and self.conn.sock:
+        try:
+          self.conn.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+          pass
+
+
     def _callback(self, listener):
       expectTranslatedResponse = False
 
-      for line in self._readline(self.conn.sock):
-        try:
-          if expectTranslatedResponse:
-            listener.onTranslatedResponse(msg)
+      for msg in self._readMessages(self.conn.sock):
+        if expectTranslatedResponse:
+          listener.onTranslatedResponse(msg)
+          continue
+
+        ## hot path: pull only the partial transcript fields out of the message
+        if PARTIAL_FORMAT in msg:
+          partial = _PARTIAL_TRANSCRIPT.search(msg)
+          if partial:
+            listener.onPartialTranscript(json.loads(partial.group(1)))
+            if _SAFE_TO_STOP.search(msg):
+              ## Because of the GIL, simple flag assignment like this is atomic
+              self.audioFinished = True
             continue
 
-          parsedMsg = json.loads(line)
-          if "Format" in parsedMsg:
-            if parsedMsg["Format"] == "SoundHoundVoiceSearchParialTranscript":
-              ## also check SafeToStopAudio
-              listener.onPartialTranscript(parsedMsg["PartialTranscript"])
-              if "SafeToStopAudio" in parsedMsg and parsedMsg["SafeToStopAudio"]:
-                ## Because of the GIL, simple flag assignment like this is atomic
-                self.audioFinished = True
-
-            if parsedMsg["Format"] == "SoundHoundVoiceSearchResult":
-              ## Check for ConversationState and ConversationStateTime
-              if "ResultsAreFinal" in parsedMsg:
-                expectTranslatedResponse = True
-              if "AllResults" in parsedMsg:
-                for result in parsedMsg["AllResults"]:
-                  if "ConversationState" in result:
-                    self.HoundRequestInfo["ConversationState"] = result["ConversationState"]
-                    if "ConversationStateTime" in result["ConversationState"]:
-                      self.HoundRequestInfo["ConversationStateTime"] = result["ConversationState"]["ConversationStateTime"]
-              listener.onFinalResponse(parsedMsg)
-
-          elif "status" in parsedMsg:
-            if parsedMsg["status"] != "ok":
-              listener.onError(parsedMsg)
-              break
-        except:
-          pass
+        if RESULT_FORMAT in msg and not self.decodeFinalResponse:
+          ## the full result is large; hand it over undecoded
+          if '"ResultsAreFinal"' in msg:
+            expectTranslatedResponse = True
+          listener.onFinalResponse(msg)
+          continue
+
+        try:
+          parsedMsg = json.loads(msg)
+        except ValueError:
+          continue
+
+        if "Format" in parsedMsg:
+          if parsedMsg["Format"] == "SoundHoundVoiceSearchParialTranscript":
+            listener.onPartialTranscript(parsedMsg.get("PartialTranscript", ""))
+            if parsedMsg.get("SafeToStopAudio"):
+              self.audioFinished = True
+
+          if parsedMsg["Format"] == "SoundHoundVoiceSearchResult":
+            ## Check for ConversationState and ConversationStateTime
+            if "ResultsAreFinal" in parsedMsg:
+              expectTranslatedResponse = True
+            if "AllResults" in parsedMsg:
+              for result in parsedMsg["AllResults"]:
+                if "ConversationState" in result:
+                  self.HoundRequestInfo["ConversationState"] = result["ConversationState"]
+                  if "ConversationStateTime" in result["ConversationState"]:
+                    self.HoundRequestInfo["ConversationStateTime"] = result["ConversationState"]["ConversationStateTime"]
+            listener.onFinalResponse(parsedMsg)
+
+        elif "status" in parsedMsg:
+          if parsedMsg["status"] != "ok":
+            listener.onError(parsedMsg)
+            break
 
 
     def _wavHeader(self, sampleRate=16000):
@@ -281,25 +357,71 @@ class StreamingHoundClient(_BaseHoundClient):
       return genHeader
 
 
-    def _send(self, msg):
+    def _send(self, *msgs):
+      """
+      Write each message as one HTTP chunk; all chunks go out in one send call
+      """
       if self.conn:
-        self.conn.send("%x\r\n" % len(msg))
-        self.conn.send(msg + '\r\n')
+        out = bytearray()
+        for msg in msgs:
+          out += "%x\r\n" % len(msg)
+          out += msg
+          out += "\r\n"
+        self.conn.send(out)
+
 
+    def _readMessages(self, socket):
+      """
+      Incremental reader for the newline delimited response stream. Received
+      bytes are appended to one bytearray that is only scanned past the last
+      position searched, and consumed bytes are dropped once they make up
+      half of the buffer, so the cost is linear in the size of the stream.
+      Yields each JSON object once as a string. With ObjectByteCountPrefix a
+      line holding only a byte count announces the size of the next object,
+      which is then taken whole even if it spans several lines.
+      """
+      byteCountPrefix = self.HoundRequestInfo.get('ObjectByteCountPrefix')
+      buffer = bytearray()
+      start = 0         # first unconsumed byte
+      scan = 0          # no newline in buffer[start:scan]
+      expect = None     # announced size of the next object
 
-    def _readline(self, socket):
-      buffer = ''
       while True:
-        if "\n" in buffer:
-          (line, buffer) = buffer.split("\n", 1)
-          yield line + "\n"
-          continue
-       
-        more = socket.recv(4096)
+        if expect is not None and len(buffer) > start:
+          if buffer[start] != ord('{'):
+            ## not an object after all; fall back to line framing
+            expect = None
+          elif len(buffer) - start >= expect:
+            msg = str(buffer[start:start + expect])
+            start += expect
+            scan = start
+            expect = None
+            yield msg
+            continue
+
+        if expect is None:
+          end = buffer.find('\n', scan)
+          if end >= 0:
+            line = str(buffer[start:end]).strip()
+            start = scan = end + 1
+            if byteCountPrefix and line.isdigit():
+              expect = int(line)
+            elif line.startswith('{'):
+              yield line
+            continue
+          scan = len(buffer)
+
+        if start > len(buffer) // 2:
+          del buffer[:start]
+          scan -= start
+          start = 0
+
+        more = socket.recv(65536)
         if not more: break
-        buffer += more
+        buffer.extend(more)
 
-      if buffer: yield buffer
+      line = str(buffer[start:]).strip()
+      if line.startswith('{'): yield line
 
 
 
@@ -318,7 +440,8 @@ class HoundListener:
       """
       onFinalResponse is fired when the server has completed processing the query
       and has a response.  'response' is the JSON object (as a Python dict) which
-      the server sends back.
+      the server sends back, or its undecoded JSON string if the client was
+      created with decodeFinalResponse = False.
       """
       pass
     def onTranslatedResponse(self, response):
@@ -8,32 +8,80 @@ import os                                        # for listing directories
 import Queue                                     # queue used for thread syncronization
 import sys                                       # system calls
 import argparse                                  # for parsing arguments
-import thread
-import Queue
 import base64
+import socket
+import keycache
+import metrics
+import time
 import utils
 import logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # WebSocket client
-from ws4py.client.threadedclient import WebSocketClient
-
-def get_credentials():
-   with open('asr/ibm_key.json') as f:
-      creds = json.load(f)
-   return creds['credentials']
-
-class ASRClient(WebSocketClient):
-    def __init__(self, url, headers, chunkIterator, responseQueue, contentType, config):
-        self.chunkIterator = chunkIterator
+from ws4py.client import WebSocketBaseClient
+from ws4py.manager import WebSocketManager
+
+# kernel send buffer per session websocket
+SEND_BUFFER = 64*1024
+
+# recognize endpoint (fakes.start points it at a local stand-in)
+URL = "wss://stream.watsonplatform.net/speech-to-text/api/v1/recognize"
+KEY_FILE = 'asr/ibm_key.json'
+
+# name prefix of the audio sender thread of each stream
+SENDER_PREFIX = 'ibm-send-'
+
+# content type of the audio per upstream encoding
+_CONTENT_TYPES = {
+    'LINEAR16': 'audio/l16; rate=16000',
+    'FLAC': 'audio/flac',
+    'OGG_OPUS': 'audio/ogg;codecs=opus',
+}
+
+_CONNECT_SECONDS = metrics.histogram('stt_asr_connect_seconds',
+    'Time to open a backend stream', ['asr']).labels('ibm')
+_ERRORS = metrics.counter('stt_asr_errors_total',
+    'Backend streams that ended in an error', ['asr']).labels('ibm')
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    """ One event loop (epoll/select thread) shared by the websockets
+        of all IBM sessions
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = WebSocketManager()
+            _manager.daemon = True
+            _manager.start()
+    return _manager
+
+def _auth_headers(creds_json):
+   creds = creds_json['credentials']
+   string = creds['username'] + ":" + creds['password']
+   return {"Authorization": "Basic " + base64.b64encode(string)}
+
+def get_auth_headers():
+   return keycache.cache.get(KEY_FILE, _auth_headers)
+
+class ASRClient(WebSocketBaseClient):
+    def __init__(self, url, headers, responseQueue, contentType, config):
         self.responseQueue = responseQueue
         self.contentType = contentType
         self.listeningMessages = 0
         self.config = config
-        WebSocketClient.__init__(self, url, headers=headers.items())
+        self.confidence = -1
+        WebSocketBaseClient.__init__(self, url, headers=headers.items())
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
         logger.debug("IBM initialized")
 
+    def handshake_ok(self):
+        # the shared manager calls opened() and reads from now on
+        get_manager().add(self)
+
     def opened(self):
         data = {"action" : "start", "content-type" : str(self.contentType),
         "continuous" : self.config['continuous'], "interim_results" : True, "inactivity_timeout": 100}
@@ -47,18 +95,6 @@ class ASRClient(WebSocketClient):
         self.send(json.dumps(data).encode('utf8'))
         logger.debug("IBM initialization parameters sent")
 
-        def send_chunk():
-            try:
-                for data in self.chunkIterator:
-                    self.send(data, binary=True)
-                    logger.debug("Sending to IBM = %d", len(data))
-                self.send(b'', binary=True)
-            except:
-                logger.debug("Abort sending. Closed called by server")
-
-        t = threading.Thread(target=send_chunk)
-        t.start()
-
     def closed(self, code, reason=None):
         logger.debug("Closed down %s %s", code, reason)
         if code != 2000:
@@ -68,8 +104,8 @@ class ASRClient(WebSocketClient):
 
     def received_message(self, msg):
 
-        payload = msg.data
-        jsonObject = json.loads(payload.decode('utf8'))
+        # decode every message exactly once
+        jsonObject = json.loads(msg.data.decode('utf8'))
         if 'state' in jsonObject:
             self.listeningMessages += 1
             if (self.listeningMessages == 2):
@@ -79,56 +115,95 @@ class ASRClient(WebSocketClient):
 
          # if in streaming
         elif 'results' in jsonObject:
-            jsonObject = json.loads(payload.decode('utf8'))
-            hypothesis = ""
+            results = jsonObject['results']
 
             # empty hypothesis
-            if (len(jsonObject['results']) == 0):
+            if (len(results) == 0):
                 logger.error( "empty hypothesis!")
                 self.responseQueue.put('EOS')
                 self.close(2000)
             # regular hypothesis
             else:
-                jsonObject = json.loads(payload.decode('utf8'))
-                hypothesis = jsonObject['results'][0]['alternatives'][0]['transcript']
-                bFinal = (jsonObject['results'][0]['final'] == True)
+                hypothesis = results[0]['alternatives'][0]['transcript']
+                bFinal = (results[0]['final'] == True)
                 self.responseQueue.put(hypothesis)
                 if bFinal:
+                    self.confidence = results[0]['alternatives'][0].get('confidence', -1)
                     # print "got final", self.listeningMessages
                     logger.debug('IBM fnished from final hypothesis')
                     self.responseQueue.put('EOS')
                     self.close(2000)
 
 
+def send_audio(client, chunkIterator, responseQueue, finished):
+    """ Sends the audio until it ends or IBM finishes """
+    try:
+        for data in chunkIterator:
+            if finished.is_set():
+                return
+            client.send(data, binary=True)
+            logger.debug("Sending to IBM = %d", len(data))
+        client.send(b'', binary=True)
+    except socket.error:
+        logger.debug("Abort sending. Closed called by server")
+    except:
+        logger.error('audio stream error: %s', sys.exc_info()[0])
+        responseQueue.put('EOS')
+
+
 class worker:
 
     def __init__(self, token):
         self.token = token
+        self.cancelled = False
+        self.client = None
+        self.responseQueue = Queue.Queue()
+
+    def cancel(self):
+        ''' Abort the recognition; the final with the transcript so far still follows '''
+        self.cancelled = True
+        self.responseQueue.put('EOS')
+        if self.client is not None:
+            self.client.close(1000)
 
     def stream(self, chunkIterator, config=None):
+        """ Responses are read by the shared manager and passed on as
+            they come. The audio source blocks until the client sends
+            more, so it is read and sent by one sender thread per stream
+            (SENDER_PREFIX); it stops reading once IBM finishes.
+        """
         # parse command line parameters
-        contentType = 'audio/l16; rate=16000'
+        encoding = (config or {}).get('encoding', 'LINEAR16')
+        contentType = _CONTENT_TYPES[encoding]
         model = 'en-US_BroadbandModel'
         optOut = False
 
-        hostname = "stream.watsonplatform.net"
-        headers = {}
+        headers = dict(get_auth_headers())
         if (optOut == True):
             headers['X-WDC-PL-OPT-OUT'] = '1'
 
-        creds = get_credentials()
-        string = creds['username'] + ":" + creds['password']
-        headers["Authorization"] = "Basic " + base64.b64encode(string)
-
-        url = "wss://" + hostname + "/speech-to-text/api/v1/recognize?model=" + model
+        url = URL + "?model=" + model
 
-        responseQueue = Queue.Queue()
+        responseQueue = self.responseQueue
 
         last_transcript = ''
+        client = None
+        finished = threading.Event()
         try:
-            client = ASRClient(url, headers, chunkIterator, responseQueue, contentType, config)
+            start = time.time()
+            client = ASRClient(url, headers, responseQueue, contentType, config)
             client.connect()
+            _CONNECT_SECONDS.observe(time.time() - start)
+            self.client = client
+            if self.cancelled:
+                client.close(1000)
             logger.info("%s: Initialized", self.token)
+
+            t = threading.Thread(target=send_audio, name=SENDER_PREFIX + self.token,
+                args=(client, chunkIterator, responseQueue, finished))
+            t.daemon = True
+            t.start()
+
             responseIterator =  iter(responseQueue.get, 'EOS')
             for response in responseIterator:
                 last_transcript = response
@@ -136,8 +211,12 @@ class worker:
         except:
             e = sys.exc_info()[0]
             logger.error('%s: %s connection error', self.token, e)
+            if not self.cancelled:
+                _ERRORS.inc()
         finally:
-            yield {'transcript' : last_transcript, 'is_final': True}
+            finished.set()
+            yield {'transcript' : last_transcript, 'is_final': True,
+                'confidence': client.confidence if client is not None else -1}
             logger.info('%s: finished', self.token)
 
 
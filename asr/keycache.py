@@ -0,0 +1,43 @@
+""" Credential cache shared by the ASR backends """
+
+import json
+import os
+import threading
+import time
+
+
+class KeyCache:
+	''' Loads a JSON credential file once and keeps the auth material
+		prepared from it (headers, decoded keys). The file's mtime is
+		checked at most every `check_interval` seconds and the file is
+		re-read only when it has changed.
+	'''
+
+	def __init__(self, check_interval=1.0):
+		self.check_interval = check_interval
+		self.lock = threading.Lock()
+		self.entries = {} # (path, prepare) -> [mtime, last check, value]
+
+	def get(self, path, prepare):
+		''' Return prepare(<parsed json of path>), cached '''
+		key = (path, prepare)
+		now = time.time()
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is not None and now - entry[1] < self.check_interval:
+				return entry[2]
+
+		mtime = os.stat(path).st_mtime
+		if entry is not None and entry[0] == mtime:
+			with self.lock:
+				entry[1] = now
+			return entry[2]
+
+		with open(path) as f:
+			value = prepare(json.load(f))
+		with self.lock:
+			self.entries[key] = [mtime, now, value]
+		return value
+
+
+cache = KeyCache()
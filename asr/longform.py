@@ -0,0 +1,315 @@
+""" Long-form streaming: rotation of backend streams and transcript stitching
+
+Cloud streams are capped (Google ends a stream after about a minute), so
+a long recording is sent as a series of overlapping segments, each on a
+stream of its own. worker wraps the worker of any asr module with the
+same stream()/cancel() interface.
+"""
+
+import logging
+import math
+import Queue
+import re
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_ROTATIONS = metrics.counter('stt_longform_rotations_total',
+	'Backend streams replaced by a new segment: at a pause, at the limit or ended by the backend',
+	['asr', 'reason'])
+_OVERLAP_WORDS = metrics.counter('stt_longform_overlap_words_total',
+	'Words heard twice at a segment boundary and dropped', ['asr'])
+
+# most words spoken per second; bounds the words a replayed overlap can repeat
+_WORDS_PER_SECOND = 4
+# fewer words matching at a cut are taken as genuine repeats
+_MIN_OVERLAP_WORDS = 2
+
+_DONE = object()
+_FED = object()
+
+
+def _norm(word):
+	return re.sub(r"[^\w']", '', word.lower())
+
+
+def dedup(previous, words, max_words):
+	''' Words of a new segment minus the ones that repeat the end of the
+		previous text (both lists of words). The longest suffix of
+		previous of at least _MIN_OVERLAP_WORDS and at most max_words
+		words equal to a prefix of words is dropped; the first word may
+		differ, as the cut can fall inside it.
+	'''
+	tail = [_norm(w) for w in previous[-max_words:]]
+	head = [_norm(w) for w in words[:max_words]]
+	for k in xrange(min(len(tail), len(head)), _MIN_OVERLAP_WORDS - 1, -1):
+		if tail[-k:] == head[:k] or (k > _MIN_OVERLAP_WORDS and tail[-k+1:] == head[1:k]):
+			return words[k:]
+	return words
+
+
+class _Segment:
+	''' The audio of one backend stream '''
+
+	def __init__(self, index, replay, heard):
+		self.index = index
+		self.queue = Queue.Queue()
+		self.chunks = [] # every chunk queued
+		self.heard = heard # leading chunks an earlier backend heard
+		self.read = 0 # chunks the backend has read
+		self.end = None # chunks read when the backend sent its final or stopped
+		self.done = threading.Event()
+		for data in replay:
+			self.put(data)
+
+	def put(self, data):
+		self.chunks.append(data)
+		self.queue.put(data)
+
+	def audio(self):
+		for data in iter(self.queue.get, _DONE):
+			self.read += 1
+			yield data
+
+	def finish(self):
+		''' End the audio after what is queued '''
+		self.queue.put(_DONE)
+
+	def unheard(self, overlap_bytes):
+		''' The audio after the end of the backend, led by the last
+			overlap_bytes it heard, and the number of chunks of it heard;
+			None if the backend heard nothing new
+		'''
+		if self.end <= self.heard:
+			return None
+		heard = _last(self.chunks[:self.end], overlap_bytes)
+		return heard + self.chunks[self.end:], len(heard)
+
+
+def _last(chunks, nbytes):
+	''' The last chunks holding at least nbytes '''
+	start = len(chunks)
+	n = 0
+	while start > 0 and n < nbytes:
+		start -= 1
+		n += len(chunks[start])
+	return chunks[start:]
+
+
+class worker:
+	''' Streams continuous audio through a new backend stream every
+		segment. A feeder thread reads the audio and passes it to the
+		stream of the current segment. After `segment` seconds the next
+		pause ends the segment: its stream gets the end of audio and
+		finishes on its own while the next one takes over with the next
+		chunk. A pause is when pause(), the ms the speaker has been
+		silent at the end of the chunk read last (as the session VAD
+		marks it), reaches `min_pause`. Without a pause the segment is
+		cut at `limit` seconds and the next one starts with the last
+		`overlap` seconds replayed, so no word is lost in the cut. A
+		backend may also end its stream early (IBM and Hound stop at
+		their own end of utterance): the audio it had not read when it
+		ended is then sent on a new segment, after the last `overlap`
+		seconds it heard. Transcripts are stitched in segment order,
+		the words repeated after a cut dropped; partials carry the
+		whole text so far and one final ends the stream.
+	'''
+
+	def __init__(self, module, token, asr=None, segment=50.0, limit=55.0, overlap=1.0,
+			rate=16000, encode=None, pause=None, min_pause=200):
+		self.module = module
+		self.token = token
+		self.asr = asr or module.__name__.split('.')[-1]
+		self.segment_bytes = int(2*rate*segment)
+		self.limit_bytes = int(2*rate*limit)
+		self.overlap_bytes = int(2*rate*overlap)
+		self.overlap_words = max(_MIN_OVERLAP_WORDS, int(math.ceil(_WORDS_PER_SECOND*overlap)))
+		self.rate = rate
+		self.encode = encode
+		self.pause = pause
+		self.min_pause = min_pause
+
+		self.lock = threading.Lock()
+		self.cancelled = False
+		self.workers = [] # backend worker of every segment started
+		self.overlapped = set() # segments starting with replayed overlap
+		self.responses = Queue.Queue() # (segment, response), (segment, _DONE) or _FED
+		self.source = None
+
+	def cancel(self):
+		''' Abort every segment; the final with the text so far still follows '''
+		with self.lock:
+			self.cancelled = True
+			workers = list(self.workers)
+		for w in workers:
+			w.cancel()
+
+	def _start(self, replay, heard):
+		''' Open the stream of the next segment, starting with replay
+			(of which the first `heard` chunks were heard before); None
+			once cancelled
+		'''
+		with self.lock:
+			if self.cancelled:
+				return None
+			segment = _Segment(len(self.workers), replay, heard)
+			w = self.module.worker('%s-%d' % (self.token, segment.index))
+			self.workers.append(w)
+			if replay:
+				self.overlapped.add(segment.index)
+		t = threading.Thread(target=self._pump, args=(segment, w))
+		t.daemon = True
+		t.start()
+		return segment
+
+	def _pump(self, segment, w):
+		chunks = segment.audio()
+		if self.encode is not None:
+			chunks = self.encode(chunks)
+		try:
+			for response in w.stream(chunks, self.config):
+				if response['is_final'] and segment.end is None:
+					segment.end = segment.read
+				self.responses.put((segment.index, response))
+		finally:
+			if segment.end is None:
+				segment.end = segment.read
+			segment.done.set()
+			self.responses.put((segment.index, _DONE))
+
+	def _restart(self, segment):
+		''' The segment after one whose backend ended before the end of
+			its audio; None if there is nothing more to send
+		'''
+		logger.info('%s: %s segment %d ended by the backend', self.token, self.asr,
+			segment.index)
+		unheard = segment.unheard(self.overlap_bytes)
+		if unheard is None:
+			logger.warning('%s: %s segment %d heard no new audio, not restarted', self.token,
+				self.asr, segment.index)
+			return None
+		_ROTATIONS.labels(self.asr, 'backend').inc()
+		return self._start(*unheard)
+
+	def _feed(self):
+		''' Pass the audio on to the current segment, rotating segments.
+			The next segment is opened with the chunk after a rotation,
+			so the audio never ends on an empty segment.
+		'''
+		segment = None
+		replay = []
+		try:
+			for data in self.source:
+				if self.cancelled:
+					break
+				if segment is not None and segment.end is not None:
+					segment.finish()
+					segment = self._restart(segment)
+					if segment is None:
+						break
+					sent = sum(len(chunk) for chunk in segment.chunks)
+
+				if segment is None:
+					segment = self._start(replay, len(replay))
+					if segment is None:
+						break
+					sent = sum(len(chunk) for chunk in replay)
+
+				segment.put(data)
+				sent += len(data)
+				paused = self.pause is not None and self.pause() >= self.min_pause
+				if sent >= self.limit_bytes or (sent >= self.segment_bytes and paused):
+					reason = 'pause' if paused else 'limit'
+					logger.info('%s: %s segment %d ends at a %s after %.1f s', self.token,
+						self.asr, segment.index, reason, sent/(2.0*self.rate))
+					_ROTATIONS.labels(self.asr, reason).inc()
+					segment.finish()
+					# a cut in the middle of speech is heard again by the next segment
+					replay = _last(segment.chunks, self.overlap_bytes) if reason == 'limit' else []
+					segment = None
+			else:
+				# the audio is in: the last backends may still end before hearing all of it
+				while segment is not None:
+					segment.finish()
+					segment.done.wait()
+					if segment.end >= len(segment.chunks):
+						break
+					segment = self._restart(segment)
+		finally:
+			if segment is not None:
+				segment.finish()
+			self.responses.put(_FED)
+
+	def _stitch(self, texts, finals):
+		''' The whole transcript from the text of every segment. Leading
+			segments with their final in are joined once and kept, so a
+			partial costs the same however long the stream is.
+		'''
+		while self.committed < len(texts) and self.committed in finals:
+			new = texts[self.committed].split()
+			kept = self._dedup(self.committed_tail, new, self.committed)
+			_OVERLAP_WORDS.labels(self.asr).inc(len(new) - len(kept))
+			if kept:
+				self.committed_text = ' '.join(filter(None, [self.committed_text] + kept))
+			self.committed_tail = (self.committed_tail + kept)[-self.overlap_words:]
+			self.committed += 1
+
+		words = list(self.committed_tail)
+		pending = []
+		for index in xrange(self.committed, len(texts)):
+			kept = self._dedup(words, texts[index].split(), index)
+			words.extend(kept)
+			pending.extend(kept)
+		return ' '.join(filter(None, [self.committed_text] + pending))
+
+	def _dedup(self, previous, words, index):
+		if index not in self.overlapped:
+			return words
+		return dedup(previous, words, self.overlap_words)
+
+	def stream(self, chunkIterator, config=None):
+		self.source = iter(chunkIterator)
+		self.config = config
+		self.committed = 0 # segments joined into committed_text
+		self.committed_text = ''
+		self.committed_tail = [] # its last words
+
+		texts = []
+		confidences = {}
+		finished = 0
+		fed = False
+		last = None
+
+		feeder = threading.Thread(target=self._feed)
+		feeder.daemon = True
+		feeder.start()
+
+		# the feeder starts every segment before it is done
+		while not fed or finished < len(self.workers):
+			item = self.responses.get()
+			if item is _FED:
+				fed = True
+				continue
+			index, response = item
+			if response is _DONE:
+				finished += 1
+				continue
+			while len(texts) <= index:
+				texts.append('')
+			texts[index] = response['transcript']
+			if response['is_final']:
+				confidences[index] = response.get('confidence', -1)
+				continue
+
+			transcript = self._stitch(texts, confidences)
+			if transcript != last:
+				last = transcript
+				yield {'transcript': transcript, 'is_final': False, 'confidence': -1}
+
+		known = [c for c in confidences.values() if c >= 0]
+		transcript = self._stitch(texts, set(xrange(len(texts))))
+		logger.info('%s: %s finished after %d segments', self.token, self.asr, len(self.workers))
+		yield {'transcript': transcript, 'is_final': True,
+			'confidence': sum(known)/len(known) if known else -1}
@@ -0,0 +1,88 @@
+""" Streaming sample-rate conversion and downmix of 16-bit PCM """
+
+import fractions
+import math
+
+import numpy as np
+
+# rate every asr (and the VAD) is fed at
+NATIVE_RATE = 16000
+RATES = [8000, 11025, 16000, 22050, 32000, 44100, 48000]
+
+
+class Resampler:
+	''' Converts interleaved 16-bit PCM with `channels` channels at
+		`in_rate` to mono at `out_rate`, one chunk at a time. A
+		windowed-sinc low-pass is applied as a polyphase filter: for
+		each output sample one row of filter taps is dotted with the
+		input around it, all outputs of a chunk at once. The input tail
+		the filter still needs is kept between chunks, so chunk
+		boundaries do not show in the output.
+	'''
+
+	def __init__(self, in_rate, out_rate=NATIVE_RATE, channels=1, zero_crossings=16):
+		ratio = fractions.Fraction(out_rate, in_rate)
+		self.up, self.down = ratio.numerator, ratio.denominator
+		self.channels = channels
+		self.leftover = ''
+
+		if self.up == self.down:
+			self.poly = None
+			return
+
+		# filter taps per output sample, covering zero_crossings
+		# periods of the lower of the two rates
+		self.taps = int(math.ceil(zero_crossings*max(self.up, self.down)/float(self.up)))
+		n = self.taps*self.up
+		cutoff = 0.5/max(self.up, self.down) # cycles per upsampled sample
+		t = np.arange(n) - (n - 1)/2.0
+		h = 2*cutoff*np.sinc(2*cutoff*t)*np.kaiser(n, 8.0)
+		h *= self.up/h.sum()
+		# row p holds the taps of phase p, newest input first
+		self.poly = h.reshape(self.taps, self.up).T.astype(np.float32)
+
+		self.history = np.zeros(self.taps - 1, dtype=np.float32)
+		self.consumed = 0 # input samples seen
+		self.produced = 0 # output samples made
+
+	def process(self, data):
+		''' Convert a chunk; returns the output it completes (may be empty) '''
+		data = self.leftover + data
+		frame = 2*self.channels
+		end = len(data) - len(data) % frame
+		self.leftover = data[end:]
+
+		x = np.frombuffer(data[:end], dtype='<i2')
+		if self.channels > 1:
+			x = x.reshape(-1, self.channels).mean(axis=1)
+		if self.poly is None:
+			if self.channels == 1:
+				return data[:end]
+			return x.astype('<i2').tobytes()
+
+		buf = np.concatenate((self.history, x.astype(np.float32)))
+		buf_start = self.consumed - len(self.history) # input index of buf[0]
+		self.consumed += len(x)
+
+		# outputs whose newest input sample has arrived
+		last = (self.consumed*self.up - 1)//self.down
+		n = np.arange(self.produced, last + 1)
+		self.produced = last + 1
+		self.history = buf[len(buf) - (self.taps - 1):]
+		if not len(n):
+			return ''
+
+		pos = n*self.down
+		newest = pos//self.up - buf_start
+		idx = newest[:, None] - np.arange(self.taps)[None, :]
+		y = np.einsum('ij,ij->i', buf[idx], self.poly[pos % self.up])
+		return np.clip(np.round(y), -32768, 32767).astype('<i2').tobytes()
+
+
+def convert(chunks, in_rate, channels=1, out_rate=NATIVE_RATE):
+	''' Iterator over chunks converted to mono at out_rate '''
+	resampler = Resampler(in_rate, out_rate, channels)
+	for chunk in chunks:
+		data = resampler.process(chunk)
+		if data:
+			yield data
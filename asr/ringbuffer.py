@@ -0,0 +1,157 @@
+""" Single-producer / multi-consumer audio ring buffer """
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AudioRingBuffer:
+	''' Fans one stream of audio chunks out to several consumers. Each
+		chunk is stored once and every consumer walks the shared slots
+		with its own Cursor, so a write costs one lock round trip no
+		matter how many consumers there are. End-of-stream is the closed
+		state of the buffer rather than an in-band marker.
+
+		The buffer is bounded: the producer waits when the slowest
+		consumer is `capacity` chunks behind, and a consumer that makes
+		no progress for `stall_timeout` seconds is detached so it cannot
+		hold the whole session back.
+
+		A consumer added late can replay the audio still held in the
+		slots, i.e. up to the last `capacity` chunks.
+
+		A chunk can be written with a mark, e.g. what the VAD made of
+		the audio so far; a consumer finds the mark of the chunk it has
+		just read in Cursor.mark.
+	'''
+
+	def __init__(self, capacity=256, stall_timeout=10.0):
+		self.capacity = capacity
+		self.stall_timeout = stall_timeout
+		self.slots = [None]*capacity
+		self.marks = [None]*capacity
+		self.head = 0 # number of chunks written so far
+		self.closed = False
+		self.cursors = []
+
+		self.lock = threading.Lock()
+		self.not_empty = threading.Condition(self.lock)
+		self.not_full = threading.Condition(self.lock)
+
+	def reader(self, replay=False):
+		''' Register a consumer that starts at the current write position,
+			or with replay at the oldest chunk still held
+		'''
+		with self.lock:
+			pos = self.head
+			if replay:
+				pos = max(0, self.head - self.capacity)
+				if pos:
+					logger.warning('Replaying only the last %d audio chunks', self.capacity)
+			cursor = Cursor(self, pos)
+			self.cursors.append(cursor)
+		return cursor
+
+	def _slowest(self):
+		return min([c.pos for c in self.cursors] or [self.head])
+
+	def write(self, data, mark=None):
+		''' Append a chunk. Chunks written after close() are dropped '''
+		with self.lock:
+			if self.closed:
+				return
+
+			while self.head - self._slowest() >= self.capacity:
+				# a consumer that is behind but still reading is waited for
+				now = time.time()
+				behind = [c for c in self.cursors if self.head - c.pos >= self.capacity]
+				deadline = min(c.progress for c in behind) + self.stall_timeout
+				if deadline > now:
+					self.not_full.wait(deadline - now)
+					continue
+				for c in behind:
+					if now - c.progress >= self.stall_timeout:
+						logger.warning('Detaching audio consumer stalled for %.1f s',
+							now - c.progress)
+						self._detach(c)
+
+			self.slots[self.head % self.capacity] = data
+			self.marks[self.head % self.capacity] = mark
+			self.head += 1
+			self.not_empty.notify_all()
+
+	def depth(self):
+		''' Chunks written but not yet read by the slowest consumer '''
+		with self.lock:
+			return self.head - self._slowest()
+
+	def close(self):
+		''' Mark end-of-stream; consumers stop once they have drained '''
+		with self.lock:
+			self.closed = True
+			self.not_empty.notify_all()
+
+	def _detach(self, cursor):
+		if cursor in self.cursors:
+			self.cursors.remove(cursor)
+		cursor.detached = True
+		self.not_empty.notify_all()
+		self.not_full.notify_all()
+
+	def _read(self, cursor):
+		''' Block until the cursor has unread chunks and hand back all of
+			them at once, with their marks. Empty lists mean end-of-stream.
+		'''
+		with self.lock:
+			while cursor.pos == self.head and not self.closed and not cursor.detached:
+				self.not_empty.wait()
+
+			if cursor.detached:
+				return [], []
+
+			items = [self.slots[i % self.capacity] for i in xrange(cursor.pos, self.head)]
+			marks = [self.marks[i % self.capacity] for i in xrange(cursor.pos, self.head)]
+			cursor.pos = self.head
+			cursor.progress = time.time()
+			self.not_full.notify()
+			return items, marks
+
+
+class Cursor:
+	''' Iterator over an AudioRingBuffer for one consumer. Stops at
+		end-of-stream or once close() is called on it.
+	'''
+
+	def __init__(self, ring, pos):
+		self.ring = ring
+		self.pos = pos
+		self.detached = False
+		self.progress = time.time() # when the cursor last read
+		self.bytes = 0 # audio read so far
+		self.mark = None # of the chunk read last
+		self.batch = []
+		self.marks = []
+		self.ix = 0
+
+	def __iter__(self):
+		return self
+
+	def next(self):
+		if self.ix == len(self.batch):
+			self.batch, self.marks = self.ring._read(self)
+			self.ix = 0
+			if not self.batch:
+				raise StopIteration
+
+		item = self.batch[self.ix]
+		self.mark = self.marks[self.ix]
+		self.ix += 1
+		self.bytes += len(item)
+		return item
+
+	def close(self):
+		''' Stop consuming; the producer no longer waits for this cursor '''
+		with self.ring.lock:
+			self.ring._detach(self)
@@ -1,5 +1,6 @@
 """ Common utlities """
 
+import os
 import sys
 import proto.stt_pb2 as stt_pb2
 import time
@@ -7,7 +8,8 @@ import wave
 
 
 # create an iterator that yields chunks in raw or grpc format
-def generate_chunks(filename, grpc_on=False, chunkSize=3072):
+# pace scales the delay between chunks of a file (0: as fast as possible)
+def generate_chunks(filename, grpc_on=False, chunkSize=3072, pace=1.0):
 	#raw byte file
 	if '.raw' in filename:
 		f = open(filename, 'rb')
@@ -21,7 +23,8 @@ def generate_chunks(filename, grpc_on=False, chunkSize=3072):
 					yield chunk
 			else:
 				raise StopIteration
-			time.sleep(0.1*chunkSize/3072.0)
+			if pace:
+				time.sleep(pace*0.1*chunkSize/3072.0)
 
 	#piped stream from terminal
 	elif 'stdin' in filename:
@@ -42,15 +45,12 @@ def generate_chunks(filename, grpc_on=False, chunkSize=3072):
         if audio.getsampwidth() != 2:
             print ('%s: wrong sample width (must be 16-bit)' % filename)
             raise StopIteration
-        if audio.getframerate() != 8000 and audio.getframerate() != 16000:
-			print ('%s: unsupported sampling frequency (must be either 8 or 16 khz)' % filename)
-			raise StopIteration
-        if audio.getnchannels() != 1:
-			print ('%s: must be single channel (mono)' % filename)
-			raise StopIteration
+        # any rate and channel count; the server converts to 16 kHz mono
+        frame = 2*audio.getnchannels()
+        speed = 32000.0/(frame*audio.getframerate()) # relative to 16 kHz mono
 
         while True:
-			chunk = audio.readframes(chunkSize//2) #each wav frame is 2 bytes
+			chunk = audio.readframes(chunkSize//frame)
 			if chunk:
 				# print len(chunk)
 				if grpc_on:
@@ -59,6 +59,35 @@ def generate_chunks(filename, grpc_on=False, chunkSize=3072):
 					yield chunk
 			else:
 				raise StopIteration
-			time.sleep(0.1*chunkSize/3072.0)
+			if pace:
+				time.sleep(pace*speed*0.1*chunkSize/3072.0)
 	else:
-		raise StopIteration
\ No newline at end of file
+		raise StopIteration
+
+
+class DeltaEncoder:
+	''' Encodes successive transcripts of one asr as the length of the
+		prefix shared with the previous one plus the new suffix. Every
+		`snapshot_every` updates the full text is sent (prefix 0) so a
+		client can resynchronize.
+	'''
+	def __init__(self, snapshot_every=20):
+		self.snapshot_every = snapshot_every
+		self.last = None
+		self.count = 0
+
+	def encode(self, text, snapshot=False):
+		''' Returns (prefix_length, suffix) '''
+		if snapshot or self.last is None or self.count >= self.snapshot_every:
+			prefix_length = 0
+			self.count = 0
+		else:
+			prefix_length = len(os.path.commonprefix([self.last, text]))
+		self.count += 1
+		self.last = text
+		return prefix_length, text[prefix_length:]
+
+
+# rebuild a transcript from the previous one and a delta
+def apply_delta(previous, prefix_length, suffix):
+	return previous[:prefix_length] + suffix
@@ -0,0 +1,337 @@
+""" Incremental voice activity detection and end-pointing """
+
+import audioop
+import collections
+import math
+import webrtcvad
+
+# events returned by Endpointer.push() and FastEndpointer.push()
+START_OF_SPEECH = 'start_of_speech'
+END_OF_SPEECH = 'end_of_speech'
+NO_SPEECH = 'no_speech'
+
+
+class Frames:
+	''' Frames a stream of LINEAR16 audio for webrtcvad through one
+		reusable buffer (no per-frame bytes objects) and runs the VAD
+		once per frame. Every VAD consumer of a session (Endpointer,
+		FastEndpointer, Gate) is fed the frames and decisions made here.
+	'''
+
+	def __init__(self, rate=16000, frame_len=10, mode=3):
+		# webrtc takes chunks of only 10ms/20ms/30ms
+		self.rate = rate
+		self.frame_len = frame_len
+		self.frame_bytes = 2*rate*frame_len//1000 # 2Bytes/sample
+
+		self.vad = webrtcvad.Vad()
+		self.vad.set_mode(mode)
+
+		self.frame = bytearray(self.frame_bytes)
+		self.fill = 0
+
+	def process(self, data):
+		''' Feed raw LINEAR16 bytes of any length. Yields (frame, voiced)
+			for every frame completed; frame is the shared buffer, only
+			valid until the next one.
+		'''
+		view = memoryview(data)
+		n = len(view)
+		offset = 0
+
+		while offset < n:
+			take = min(self.frame_bytes - self.fill, n - offset)
+			self.frame[self.fill:self.fill+take] = view[offset:offset+take]
+			self.fill += take
+			offset += take
+
+			if self.fill == self.frame_bytes:
+				self.fill = 0
+				yield self.frame, self.vad.is_speech(self.frame, self.rate)
+
+	def flush(self):
+		''' The partial frame left at the end of the stream '''
+		data = str(self.frame[:self.fill])
+		self.fill = 0
+		return data
+
+
+class EndpointPolicy:
+	''' Online end-pointing policy of one session. It tracks the noise
+		floor of the stream (frame energy, quick to fall and slow to
+		rise) so that only frames clearly above it count as speech, and
+		the pauses of the speaker between words and phrases. The
+		trailing silence that ends the speech is the average pause plus
+		three standard deviations, kept between min_window and
+		max_window ms. The pause statistics start from a prior worth
+		two pauses that gives the fixed window's silence, 0.9*inactivity.
+	'''
+
+	def __init__(self, inactivity, min_window=None, max_window=None, margin_db=6.0,
+			min_pause=60):
+		self.min_window = min_window or inactivity/4.0
+		self.max_window = max_window or 2.0*inactivity
+		self.margin_db = margin_db
+		self.min_pause = min_pause
+		self.silence = 0.9*inactivity
+
+		self.noise_db = None
+		self.pauses = 0
+		self.pause_mean = 0.3*inactivity
+		self.pause_var = (0.2*inactivity)**2
+
+	def is_speech(self, voiced, rms):
+		''' Final speech decision of a frame the VAD calls voiced or not,
+			updating the noise floor
+		'''
+		level = 20*math.log10(rms + 1)
+		if self.noise_db is None:
+			self.noise_db = level
+		elif level < self.noise_db:
+			self.noise_db += 0.2*(level - self.noise_db)
+		elif not voiced:
+			self.noise_db += 0.01*(level - self.noise_db)
+		return voiced and level > self.noise_db + self.margin_db
+
+	def pause(self, ms):
+		''' A pause of ms ended in speech; returns the new trailing silence
+			in ms, or None if it is too short to count
+		'''
+		if ms < self.min_pause:
+			return None
+		# running mean and variance; early pauses weigh more
+		self.pauses += 1
+		alpha = max(0.2, 1.0/(self.pauses + 2))
+		delta = ms - self.pause_mean
+		self.pause_mean += alpha*delta
+		self.pause_var = (1 - alpha)*(self.pause_var + alpha*delta*delta)
+		self.silence = min(max(self.pause_mean + 3*math.sqrt(self.pause_var),
+			self.min_window), self.max_window)
+		return self.silence
+
+
+class Endpointer:
+	''' Streaming end-pointer fed the webrtcvad decisions of Frames.
+		The voiced count over the inactivity window is kept as a
+		running counter, so the cost per frame does not depend on the
+		window length.
+
+		Speech starts when start_ratio of the last `start_window` ms
+		are voiced, so short commands trigger too. The end window
+		follows the EndpointPolicy of the session: it is resized so
+		that end_ratio of it is the trailing silence the policy asks
+		for. A stream without speech for `no_speech` ms ends with
+		NO_SPEECH. The pause the speaker is in is kept in pause_ms.
+	'''
+
+	def __init__(self, inactivity, frame_len=10, start_ratio=0.5, end_ratio=0.9,
+			no_speech=10000, policy=None, start_window=300):
+
+		self.frame_len = frame_len
+		self.policy = policy or EndpointPolicy(inactivity)
+
+		self.window = collections.deque()
+		self.end_ratio = end_ratio
+		self.num_voiced = 0
+		self._resize(inactivity)
+
+		self.recent = collections.deque()
+		self.recent_len = max(1, start_window//frame_len)
+		self.recent_voiced = 0
+		self.start_count = start_ratio*self.recent_len
+
+		self.no_speech_frames = no_speech//frame_len if no_speech else None
+		self.frames = 0
+		self.unvoiced_run = 0
+
+		self.triggered = False
+		self.ended = False
+
+	@property
+	def num_unvoiced(self):
+		return len(self.window) - self.num_voiced
+
+	@property
+	def pause_ms(self):
+		''' Unvoiced time (ms) since the last speech, once triggered '''
+		return self.unvoiced_run*self.frame_len if self.triggered else 0
+
+	@property
+	def silence(self):
+		''' Trailing silence (ms) that currently ends the speech '''
+		return self.end_ratio*self.window_len*self.frame_len
+
+	def _resize(self, window_ms):
+		self.window_len = max(1, int(round(window_ms/self.frame_len)))
+		while len(self.window) > self.window_len:
+			if self.window.popleft():
+				self.num_voiced -= 1
+		self.end_count = self.end_ratio*self.window_len
+
+	def _push(self, is_speech):
+		''' Slide the window by one frame and return an event if the
+			trigger state changes
+		'''
+		if len(self.window) == self.window_len:
+			if self.window.popleft():
+				self.num_voiced -= 1
+		self.window.append(is_speech)
+		if is_speech:
+			self.num_voiced += 1
+
+		if not self.triggered:
+			if len(self.recent) == self.recent_len:
+				if self.recent.popleft():
+					self.recent_voiced -= 1
+			self.recent.append(is_speech)
+			if is_speech:
+				self.recent_voiced += 1
+
+			self.frames += 1
+			if self.recent_voiced > self.start_count:
+				self.triggered = True
+				# the end window starts with the speech
+				self.window.clear()
+				self.num_voiced = 0
+				return START_OF_SPEECH
+			if self.frames == self.no_speech_frames:
+				self.ended = True
+				return NO_SPEECH
+		elif not self.ended:
+			if not is_speech:
+				self.unvoiced_run += 1
+			else:
+				silence = self.policy.pause(self.unvoiced_run*self.frame_len)
+				if silence is not None:
+					self._resize(silence/self.end_ratio)
+				self.unvoiced_run = 0
+			if self.num_unvoiced > self.end_count:
+				self.ended = True
+				return END_OF_SPEECH
+		return None
+
+	def push(self, frame, voiced):
+		''' Take the next frame and its VAD decision. Returns the event
+			(START_OF_SPEECH, END_OF_SPEECH, NO_SPEECH) it raises, or None
+		'''
+		return self._push(self.policy.is_speech(voiced, audioop.rms(buffer(frame), 2)))
+
+
+class Gate:
+	''' Silence suppression: passes on only the voiced parts of a
+		stream, fed the frames and decisions of Frames. While closed, the
+		last `preroll` ms are held back; the gate opens once `trigger`
+		consecutive frames are voiced, handing on the held audio first
+		so word onsets are kept, and closes again after `hangover` ms
+		without a voiced frame. Without `reclose` it stays open once
+		opened, so only leading silence is dropped.
+	'''
+
+	def __init__(self, preroll=300, hangover=300, rate=16000, frame_len=10, trigger=3,
+			reclose=True):
+		frame_bytes = 2*rate*frame_len//1000 # 2Bytes/sample
+		self.held_bytes = max(trigger, preroll//frame_len)*frame_bytes
+		self.hangover_frames = max(1, hangover//frame_len)
+		self.trigger = trigger
+		self.reclose = reclose
+		self.held = bytearray() # audio while closed, trimmed to held_bytes now and then
+		self.out = bytearray()
+
+		self.open = False
+		self.voiced_run = 0 # consecutive voiced frames while closed
+		self.unvoiced_run = 0 # consecutive unvoiced frames while open
+		self.received = 0 # bytes in
+		self.forwarded = 0 # bytes passed on
+		self.segments = 0
+
+	def push(self, frame, voiced):
+		''' Take the next frame and its VAD decision '''
+		self.received += len(frame)
+		if self.open:
+			self.out.extend(frame)
+			self.unvoiced_run = 0 if voiced else self.unvoiced_run + 1
+			if self.reclose and self.unvoiced_run >= self.hangover_frames:
+				self.open = False
+				self.voiced_run = 0
+			return
+
+		self.held.extend(frame)
+		if len(self.held) >= 2*self.held_bytes:
+			del self.held[:len(self.held) - self.held_bytes]
+		self.voiced_run = self.voiced_run + 1 if voiced else 0
+		if self.voiced_run >= self.trigger:
+			self.open = True
+			self.unvoiced_run = 0
+			self.segments += 1
+			self.out.extend(self.held[-self.held_bytes:])
+			del self.held[:]
+
+	def take(self):
+		''' The audio passed on since the last call, possibly empty '''
+		out = str(self.out)
+		del self.out[:]
+		self.forwarded += len(out)
+		return out
+
+	def flush(self, tail):
+		''' The audio still to pass on at the end of the stream, with the
+			partial last frame tail if the gate is open
+		'''
+		self.received += len(tail)
+		if self.open:
+			self.out.extend(tail)
+		return self.take()
+
+
+class FastEndpointer:
+	''' Low-latency end-pointing on trailing silence, fed the webrtcvad
+		decisions of Frames like Endpointer. Once speech has started
+		(`trigger` consecutive voiced frames), END_OF_SPEECH is raised
+		after `hangover` ms without a voiced frame. The hangover adapts
+		to the speaker: it follows 1.5 times the running average
+		of the pauses within the utterance, kept between half and twice
+		`silence`, so slow speakers are not cut off in a pause and quick
+		ones are not kept waiting.
+	'''
+
+	def __init__(self, silence=500, frame_len=10, trigger=3, min_pause=60):
+		self.frame_len = frame_len
+		self.silence = silence
+		self.hangover = silence
+		self.pause = silence/1.5 # running average of the pauses (ms)
+		self.min_pause = min_pause
+		self.trigger = trigger
+
+		self.voiced_run = 0
+		self.unvoiced_run = 0
+		self.triggered = False
+		self.ended = False
+
+	def push(self, is_speech):
+		''' Take the VAD decision of the next frame. Returns the event
+			(START_OF_SPEECH, END_OF_SPEECH) it raises, or None; nothing
+			after END_OF_SPEECH.
+		'''
+		if self.ended:
+			return None
+		if not self.triggered:
+			self.voiced_run = self.voiced_run + 1 if is_speech else 0
+			if self.voiced_run >= self.trigger:
+				self.triggered = True
+				return START_OF_SPEECH
+			return None
+
+		if not is_speech:
+			self.unvoiced_run += 1
+			if self.unvoiced_run*self.frame_len >= self.hangover:
+				self.ended = True
+				return END_OF_SPEECH
+			return None
+
+		pause = self.unvoiced_run*self.frame_len
+		self.unvoiced_run = 0
+		if pause >= self.min_pause:
+			# speech resumed after a pause: adapt the hangover
+			self.pause = 0.7*self.pause + 0.3*pause
+			self.hangover = min(max(1.5*self.pause, self.silence/2.0), 2.0*self.silence)
+		return None
@@ -0,0 +1,131 @@
+""" Sessions per core of the threaded vs the gevent serving engine
+
+Runs N concurrent DoSpeechToText sessions in-process against echo
+backends (no network, no cloud quota) with real-time audio pacing and
+reports the CPU time spent per second of audio. Run each engine in its
+own process, e.g.
+
+	python -m bench.engine_bench -engine thread -n 200
+	python -m bench.engine_bench -engine gevent -n 200
+"""
+
+import sys
+
+if __name__ == '__main__' and 'gevent' in sys.argv:
+	from gevent import monkey
+	monkey.patch_all()
+
+import argparse
+import json
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+from proto import stt_pb2
+import stt_server
+
+
+class EchoWorker:
+	''' Stand-in ASR: a partial every few chunks and a final at the end '''
+
+	def __init__(self, token):
+		self.token = token
+
+	def stream(self, chunkIterator, config=None):
+		count = 0
+		for chunk in chunkIterator:
+			count += 1
+			if count % 3 == 0:
+				yield {'transcript': 'chunk %d' % count, 'is_final': False, 'confidence': -1}
+		yield {'transcript': 'chunk %d' % count, 'is_final': True, 'confidence': 1}
+
+
+def request_stream(token, config, audio, chunksize, pace):
+	yield stt_pb2.SpeechChunk(token=token, config=config)
+	for offset in xrange(0, len(audio), chunksize):
+		yield stt_pb2.SpeechChunk(content=audio[offset:offset+chunksize])
+		time.sleep(pace)
+
+
+def os_threads():
+	''' Native threads of this process (greenlets are not counted) '''
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith('Threads:'):
+					return int(line.split()[1])
+	except EnvironmentError:
+		return None
+
+
+def run_session(listener, ix, config, audio, chunksize, pace, results):
+	start = time.time()
+	count = 0
+	for response in listener.DoSpeechToText(
+			request_stream('bench-%d' % ix, config, audio, chunksize, pace), None):
+		count += 1
+	results.append((time.time() - start, count))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Serving engine benchmark')
+	parser.add_argument('-engine', action='store', dest='engine', default='thread',
+		choices=['thread', 'gevent'], help='serving engine')
+	parser.add_argument('-n', action='store', dest='sessions', type=int, default=100,
+		help='concurrent sessions')
+	parser.add_argument('-in', action='store', dest='filename', default='audio/audio.raw',
+		help='raw 16 kHz LINEAR16 audio')
+	parser.add_argument('-chunksize', action='store', dest='chunksize', type=int, default=3072,
+		help='bytes per chunk')
+	args = parser.parse_args()
+
+	for name in ('google', 'hound', 'ibm'):
+		getattr(stt_server, name).worker = EchoWorker
+
+	tmp = tempfile.mkdtemp()
+	stt_server._DB_PATH = tmp + '/sessions'
+	stt_server._AUDIO_PATH = tmp + '/audio'
+	listener = stt_server.Listener(archive_codec='none')
+
+	with open(args.filename, 'rb') as f:
+		audio = f.read()
+	audio_seconds = len(audio)/32000.0
+	pace = args.chunksize/32000.0
+
+	config = stt_pb2.ConfigSTT(asrs=['google', 'hound', 'ibm'], encoding='LINEAR16',
+		sampling_rate=16000, language='en-US', continuous=True, inactivity=2500,
+		chunksize=args.chunksize)
+
+	results = []
+	usage_start = resource.getrusage(resource.RUSAGE_SELF)
+	wall_start = time.time()
+	sessions = []
+	for ix in range(args.sessions):
+		t = threading.Thread(target=run_session,
+			args=(listener, ix, config, audio, args.chunksize, pace, results))
+		t.start()
+		sessions.append(t)
+	peak_threads = os_threads()
+	for t in sessions:
+		t.join()
+	wall = time.time() - wall_start
+	usage = resource.getrusage(resource.RUSAGE_SELF)
+	listener.close()
+	shutil.rmtree(tmp)
+
+	cpu = (usage.ru_utime - usage_start.ru_utime) + (usage.ru_stime - usage_start.ru_stime)
+	print json.dumps({
+		'engine': args.engine,
+		'sessions': args.sessions,
+		'completed': len(results),
+		'audio_seconds': audio_seconds,
+		'wall_seconds': wall,
+		'cpu_seconds': cpu,
+		'peak_threads': peak_threads,
+		'max_rss_kb': usage.ru_maxrss,
+		# concurrent real-time sessions one core could sustain
+		'sessions_per_core': args.sessions*audio_seconds/max(cpu, 1e-9),
+		'mean_session_seconds': sum(r[0] for r in results)/max(len(results), 1),
+	}, indent=4, sort_keys=True)
@@ -0,0 +1,66 @@
+""" Time-to-first-partial of Google streams with and without client pooling
+
+Streams the same utterance several times through asr.goog.worker, once
+with a fresh SpeechClient per utterance (the old behaviour, pool size 0)
+and once with the shared client pool, and reports the time from calling
+worker.stream() to its first partial.
+
+	python -m bench.goog_pool_bench -in audio/audio.raw -n 10
+"""
+
+import argparse
+import json
+import time
+
+import asr.goog as google
+import asr.utils as utils
+
+
+def first_partial_ms(filename, config):
+	chunks = list(utils.generate_chunks(filename, grpc_on=False, chunkSize=3072))
+	start = time.time()
+	first = None
+	for response in google.worker('bench').stream(iter(chunks), config):
+		if first is None:
+			first = 1000*(time.time() - start)
+	return first
+
+
+def percentile(values, p):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(round(p/100.0*(len(values) - 1))))]
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Google client pool benchmark')
+	parser.add_argument('-in', action='store', dest='filename', default='audio/audio.raw',
+		help='audio file')
+	parser.add_argument('-n', action='store', dest='runs', type=int, default=10,
+		help='utterances per mode')
+	parser.add_argument('-host', action='store', dest='host', default=None,
+		help='speech api host (default: the google endpoint)')
+	parser.add_argument('-port', action='store', dest='port', type=int, default=443,
+		help='speech api port')
+	args = parser.parse_args()
+
+	config = {
+	"language": "en-US",
+	"encoding":"LINEAR16",
+	"sampling_rate":google.RATE,
+	"max_alternatives":5,
+	"interim_results": True,
+	"profanity_filter": True,
+	"continuous": False,
+	}
+
+	client_args = {}
+	if args.host:
+		client_args = {'service_path': args.host, 'port': args.port}
+
+	report = {}
+	for mode, size in (('fresh_client', 0), ('pooled', 1)):
+		google.pool.configure(size=size, **client_args)
+		runs = [first_partial_ms(args.filename, config) for _ in range(args.runs)]
+		report[mode] = {'p50_ms': percentile(runs, 50), 'p95_ms': percentile(runs, 95),
+			'max_ms': max(runs)}
+	print json.dumps(report, indent=4, sort_keys=True)
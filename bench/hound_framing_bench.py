@@ -0,0 +1,76 @@
+""" Send calls and CPU per session-second of the Hound audio framing
+
+Pushes audio through StreamingHoundClient.fill() into a counting fake
+connection, once with the old framing (string concatenation and
+slicing, two sends per 20 ms frame) and once per coalescing budget of
+the current client.
+
+	python -m bench.hound_framing_bench -in audio/audio.raw -repeat 100
+"""
+
+import argparse
+import json
+import time
+
+import asr.houndify as houndify
+
+
+class CountingConnection:
+	def __init__(self):
+		self.sends = 0
+		self.bytes = 0
+
+	def send(self, data):
+		self.sends += 1
+		self.bytes += len(data)
+
+
+class LegacyFramer(houndify.StreamingHoundClient):
+	''' The framing used before the bytearray/coalescing rework '''
+
+	def fill(self, data):
+		self.buffer += data
+		frame_size = int(2 * 0.02 * self.sampleRate)
+		while len(self.buffer) > frame_size:
+			frame = self.buffer[:frame_size]
+			self._send(frame)
+			self.buffer = self.buffer[frame_size:]
+		return False
+
+	def _send(self, msg):
+		self.conn.send("%x\r\n" % len(msg))
+		self.conn.send(msg + '\r\n')
+
+
+def run(client, chunks, audio_seconds):
+	client.conn = CountingConnection()
+	client.audioFinished = False
+	client.buffer = '' if isinstance(client, LegacyFramer) else bytearray()
+	start = time.clock()
+	for chunk in chunks:
+		client.fill(chunk)
+	cpu = time.clock() - start
+	return {'sends_per_second': client.conn.sends/audio_seconds,
+		'cpu_us_per_second': 1e6*cpu/audio_seconds}
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Hound framing benchmark')
+	parser.add_argument('-in', action='store', dest='filename', default='audio/audio.raw',
+		help='raw 16 kHz LINEAR16 audio')
+	parser.add_argument('-chunksize', action='store', dest='chunksize', type=int, default=3072,
+		help='bytes per fill() call')
+	parser.add_argument('-repeat', action='store', dest='repeat', type=int, default=100,
+		help='times the audio is repeated')
+	args = parser.parse_args()
+
+	with open(args.filename, 'rb') as f:
+		audio = f.read()*args.repeat
+	chunks = [audio[i:i+args.chunksize] for i in xrange(0, len(audio), args.chunksize)]
+	audio_seconds = len(audio)/32000.0
+
+	report = {'legacy': run(LegacyFramer('id', 'a2V5', 'bench'), chunks, audio_seconds)}
+	for coalesceMs in (0, 40, 100, 200):
+		client = houndify.StreamingHoundClient('id', 'a2V5', 'bench', coalesceMs=coalesceMs)
+		report['coalesce_%dms' % coalesceMs] = run(client, chunks, audio_seconds)
+	print json.dumps(report, indent=4, sort_keys=True)
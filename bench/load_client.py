@@ -0,0 +1,202 @@
+""" Concurrent load generator and latency report for a running STT server
+
+Opens N concurrent DoSpeechToText streams through test_stt_client.Sender,
+started evenly over the ramp-up period, each streaming a file of the
+corpus (round robin) at the given pace. Per ASR it reports
+time-to-first-partial, time-to-final (from the start of the stream and
+from the end of the audio), partials per second and the error rate as
+JSON percentiles, e.g.
+
+	python -m bench.load_client -p 9080 -n 50 -ramp 10 -in audio/ -rounds 4
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import wave
+
+import asr.codec as codec
+import asr.utils as utils
+from proto import stt_pb2
+from test_stt_client import Sender
+
+_TIMEOUT_SECONDS_STREAM = 1000
+
+_AUDIO_EXTENSIONS = ('.raw', '.wav')
+
+
+def corpus(paths):
+	''' Audio files named by paths (directories are expanded) '''
+	files = []
+	for path in paths:
+		if os.path.isdir(path):
+			files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+				if name.endswith(_AUDIO_EXTENSIONS)))
+		else:
+			files.append(path)
+	return files
+
+
+def file_settings(settings, filename):
+	''' settings for streaming filename: wav files are sent as they
+		are, at their own rate and channels
+	'''
+	settings = dict(settings)
+	if filename.endswith('.wav'):
+		audio = wave.open(filename)
+		settings['sampling_rate'] = audio.getframerate()
+		settings['channels'] = audio.getnchannels()
+		audio.close()
+	return settings
+
+
+def percentiles(values):
+	if not values:
+		return None
+	values = sorted(values)
+	def at(p):
+		return values[min(len(values) - 1, int(round(p/100.0*(len(values) - 1))))]
+	return {'p50': at(50), 'p95': at(95), 'p99': at(99), 'max': values[-1],
+		'count': len(values)}
+
+
+class Session:
+	''' One stream: timestamps of the responses of each ASR '''
+
+	def __init__(self, asrs):
+		self.start = None
+		self.audio_end = None
+		self.error = None
+		self.first_partial = dict.fromkeys(asrs)
+		self.final = dict.fromkeys(asrs)
+		self.partials = dict.fromkeys(asrs, 0)
+
+	def run(self, sender, service, filename, chunksize, pace):
+		settings = sender.settings
+		def request_stream():
+			yield stt_pb2.SpeechChunk(token=token, config=config)
+			audio = utils.generate_chunks(filename, grpc_on=False, chunkSize=chunksize, pace=pace)
+			if settings['encoding'] != 'LINEAR16':
+				audio = codec.encode(audio, settings['encoding'], settings['sampling_rate'],
+					settings.get('channels', 1))
+			for content in audio:
+				yield stt_pb2.SpeechChunk(content=content)
+			self.audio_end = time.time()
+
+		try:
+			config, token = sender.configService(service)
+			self.start = time.time()
+			for response in service.DoSpeechToText(request_stream(), _TIMEOUT_SECONDS_STREAM):
+				self.on_response(response, time.time())
+		except Exception as e:
+			self.error = type(e).__name__
+
+	def on_response(self, response, now):
+		if response.asr not in self.partials:
+			return
+		if response.is_final:
+			if self.final[response.asr] is None:
+				self.final[response.asr] = now
+		elif response.transcript or response.prefix_length:
+			self.partials[response.asr] += 1
+			if self.first_partial[response.asr] is None:
+				self.first_partial[response.asr] = now
+
+
+def report(sessions, asrs, wall, completion='all'):
+	''' Per ASR latency percentiles (ms) and error rates. Under the
+		first_final and confident_final completion policies the ASRs
+		that lost are cancelled without a final, so a missing final is
+		an error only when no ASR of the session had one.
+	'''
+	winner_takes_all = completion in ('first_final', 'confident_final')
+	out = {'sessions': len(sessions), 'wall_seconds': wall,
+		'session_errors': sum(1 for s in sessions if s.error), 'asrs': {}}
+	for asr in asrs:
+		first, final, after_audio, rate = [], [], [], []
+		errors = 0
+		for s in sessions:
+			lost = winner_takes_all and any(s.final.values())
+			if s.error or (s.final[asr] is None and not lost):
+				errors += 1
+				continue
+			if s.final[asr] is None:
+				continue
+			final.append(1000*(s.final[asr] - s.start))
+			if s.audio_end is not None:
+				after_audio.append(1000*(s.final[asr] - s.audio_end))
+			if s.first_partial[asr] is not None:
+				first.append(1000*(s.first_partial[asr] - s.start))
+			rate.append(s.partials[asr]/max(s.final[asr] - s.start, 1e-3))
+		out['asrs'][asr] = {
+			'first_partial_ms': percentiles(first),
+			'final_ms': percentiles(final),
+			'final_after_audio_ms': percentiles(after_audio),
+			'partials_per_second': percentiles(rate),
+			'errors': errors,
+			'error_rate': errors/float(max(len(sessions), 1)),
+		}
+	return out
+
+
+def worker(sender, service, files, slot, args, sessions, lock):
+	time.sleep(slot*args.ramp/max(args.sessions, 1))
+	for ix in range(args.rounds):
+		filename = files[(slot + ix*args.sessions) % len(files)]
+		session = Session(sender.settings['asrs'])
+		session.run(Sender(file_settings(sender.settings, filename)), service, filename,
+			sender.settings['chunksize'], args.pace)
+		with lock:
+			sessions.append(session)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Load generator for the STT service')
+	parser.add_argument('-a', action='store', dest='ipaddr', default='localhost',
+		help='IP address of server')
+	parser.add_argument('-p', action='store', dest='port', type=int, default=9080, help='port')
+	parser.add_argument('-n', action='store', dest='sessions', type=int, default=10,
+		help='concurrent streams')
+	parser.add_argument('-rounds', action='store', dest='rounds', type=int, default=1,
+		help='streams opened one after the other by each concurrent slot')
+	parser.add_argument('-ramp', action='store', dest='ramp', type=float, default=0.0,
+		help='seconds over which the concurrent streams are started')
+	parser.add_argument('-in', action='store', dest='corpus', nargs='+',
+		default=['audio/whatistheweatherthere.wav'], help='audio files or directories')
+	parser.add_argument('-pace', action='store', dest='pace', type=float, default=1.0,
+		help='delay between chunks relative to real time (0: no delay)')
+	parser.add_argument('-settings', action='store', dest='settings', default='settings.json',
+		help='client settings')
+	parser.add_argument('-out', action='store', dest='out', default=None,
+		help='also write the report to this file')
+	args = parser.parse_args()
+
+	with open(args.settings) as f:
+		settings = json.load(f)
+	files = corpus(args.corpus)
+
+	sender = Sender(settings)
+	# one channel; concurrent streams are multiplexed on it
+	service = sender.createService(args.ipaddr, args.port)
+
+	sessions = []
+	lock = threading.Lock()
+	threads = [threading.Thread(target=worker,
+		args=(sender, service, files, slot, args, sessions, lock)) for slot in range(args.sessions)]
+	start = time.time()
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+
+	result = report(sessions, settings['asrs'], time.time() - start,
+		settings.get('completion', 'all'))
+	result.update({'concurrency': args.sessions, 'ramp_seconds': args.ramp,
+		'pace': args.pace, 'corpus': files})
+	text = json.dumps(result, indent=4, sort_keys=True)
+	if args.out:
+		with open(args.out, 'w') as f:
+			f.write(text + '\n')
+	print text
@@ -0,0 +1,49 @@
+""" CPU cost of the ingest sample-rate conversion per second of audio
+
+Converts -seconds of noise at each input rate, mono and stereo, to 16 kHz
+mono in -chunk ms chunks, the way _splitStream does, and reports the CPU
+seconds per second of audio (and the real-time sessions one core can
+convert) as JSON.
+
+	python -m bench.resample_bench -seconds 30 -chunk 100
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import asr.resample as resample
+
+
+def cpu_per_second(rate, channels, seconds, chunk_ms):
+	samples = np.random.RandomState(0).randint(-8000, 8000, int(rate*seconds)*channels)
+	data = samples.astype('<i2').tobytes()
+	step = 2*channels*rate*chunk_ms//1000
+	resampler = resample.Resampler(rate, resample.NATIVE_RATE, channels)
+	start = time.clock()
+	for offset in xrange(0, len(data), step):
+		resampler.process(data[offset:offset + step])
+	return (time.clock() - start)/seconds
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Resampler benchmark')
+	parser.add_argument('-seconds', action='store', dest='seconds', type=float, default=30.0,
+		help='seconds of audio per case')
+	parser.add_argument('-chunk', action='store', dest='chunk', type=int, default=100,
+		help='chunk length in ms')
+	args = parser.parse_args()
+
+	result = {}
+	for rate in resample.RATES:
+		for channels in (1, 2):
+			if rate == resample.NATIVE_RATE and channels == 1:
+				continue
+			cpu = cpu_per_second(rate, channels, args.seconds, args.chunk)
+			result['%d_%dch' % (rate, channels)] = {
+				'cpu_per_audio_second': cpu,
+				'realtime_sessions_per_core': 1/cpu if cpu else None,
+			}
+	print json.dumps(result, indent=4, sort_keys=True)
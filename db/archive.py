@@ -0,0 +1,197 @@
+""" Sharded, compressed archive of session audio """
+
+import collections
+import distutils.spawn
+import gzip
+import hashlib
+import io
+import logging
+import os
+import Queue
+import shutil
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_CODECS = ['none', 'gzip', 'flac']
+_REPORT_INTERVAL = 300
+
+
+class AudioArchive:
+	''' Stores the raw audio of each session under a two level sharded
+		directory (ab/cd/<token>.raw) using large buffered writes. A
+		background thread compresses finished files (gzip, or FLAC when
+		the flac encoder is installed) and enforces the retention policy:
+		total size under `max_bytes` and files younger than `max_age`
+		seconds (0 disables either limit).
+	'''
+
+	def __init__(self, path, codec='gzip', max_bytes=0, max_age=0,
+			buffer_bytes=256*1024, rate=16000):
+		if codec not in _CODECS:
+			raise Exception("Unknown archive codec: %s" % codec)
+		if codec == 'flac' and not distutils.spawn.find_executable('flac'):
+			logger.error('flac encoder not found, archiving with gzip')
+			codec = 'gzip'
+
+		self.path = path
+		self.codec = codec
+		self.max_bytes = max_bytes
+		self.max_age = max_age
+		self.buffer_bytes = buffer_bytes
+		self.rate = rate
+
+		self.lock = threading.Lock()
+		self.files = collections.deque() # (mtime, path, size), oldest first
+		self.counters = collections.Counter()
+
+		self.queue = Queue.Queue()
+		self.thread = threading.Thread(target=self._run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def _shard(self, token):
+		digest = hashlib.md5(token.encode('utf8')).hexdigest()
+		return os.path.join(self.path, digest[:2], digest[2:4])
+
+	def open(self, token):
+		''' Return a writer for the audio of a session '''
+		shard = self._shard(token)
+		if not os.path.isdir(shard):
+			try:
+				os.makedirs(shard)
+			except OSError:
+				if not os.path.isdir(shard):
+					raise
+		return ArchiveWriter(self, os.path.join(shard, '%s.raw' % token))
+
+	def _finished(self, path, size):
+		with self.lock:
+			self.counters['files_written'] += 1
+			self.counters['bytes_written'] += size
+		self.queue.put(path)
+
+	def stats(self):
+		with self.lock:
+			stats = dict(self.counters)
+			stats['files_stored'] = len(self.files)
+		return stats
+
+	def close(self):
+		''' Finish pending compression and stop the background thread '''
+		self.queue.put(None)
+		self.thread.join()
+		logger.info('Audio archive: %s', self.stats())
+
+	def _compress(self, path):
+		if self.codec == 'gzip':
+			out = path + '.gz'
+			with open(path, 'rb') as src:
+				with gzip.open(out, 'wb') as dst:
+					shutil.copyfileobj(src, dst, self.buffer_bytes)
+		elif self.codec == 'flac':
+			out = path[:-len('.raw')] + '.flac'
+			subprocess.check_call(['flac', '--silent', '--force', '--force-raw-format',
+				'--endian=little', '--sign=signed', '--channels=1', '--bps=16',
+				'--sample-rate=%d' % self.rate, '-o', out, path])
+		else:
+			return path
+		os.remove(path)
+		return out
+
+	def _add(self, path):
+		size = os.path.getsize(path)
+		with self.lock:
+			self.files.append((os.path.getmtime(path), path, size))
+			self.counters['bytes_stored'] += size
+
+	def _evict(self):
+		now = time.time()
+		while self.files:
+			with self.lock:
+				mtime, path, size = self.files[0]
+				expired = self.max_age and now - mtime > self.max_age
+				over = self.max_bytes and self.counters['bytes_stored'] > self.max_bytes
+				if not (expired or over):
+					return
+				self.files.popleft()
+				self.counters['bytes_stored'] -= size
+				self.counters['files_evicted'] += 1
+				self.counters['bytes_evicted'] += size
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+
+	def _scan(self):
+		''' Pick up files archived by earlier runs, oldest first. Raw files
+			left behind by a previous run are queued for compression.
+		'''
+		started = time.time()
+		found = []
+		for root, _, names in os.walk(self.path):
+			for name in names:
+				path = os.path.join(root, name)
+				try:
+					mtime = os.path.getmtime(path)
+					size = os.path.getsize(path)
+				except OSError:
+					continue
+				if not path.endswith('.raw'):
+					found.append((mtime, path, size))
+				elif mtime < started:
+					self.queue.put(path)
+		found.sort()
+		with self.lock:
+			self.files.extendleft(reversed(found))
+			self.counters['bytes_stored'] += sum(f[2] for f in found)
+
+	def _run(self):
+		self._scan()
+		last_report = time.time()
+		while True:
+			try:
+				path = self.queue.get(timeout=_REPORT_INTERVAL)
+			except Queue.Empty:
+				path = ''
+
+			if path is None:
+				return
+
+			if path and os.path.exists(path):
+				try:
+					path = self._compress(path)
+					if self.codec != 'none':
+						with self.lock:
+							self.counters['files_compressed'] += 1
+				except (EnvironmentError, subprocess.CalledProcessError) as e:
+					logger.error('Cannot compress %s: %s', path, e)
+				self._add(path)
+
+			self._evict()
+
+			if time.time() - last_report > _REPORT_INTERVAL:
+				logger.info('Audio archive: %s', self.stats())
+				last_report = time.time()
+
+
+class ArchiveWriter:
+	''' Buffered writer for one session; the file is handed to the
+		archive for compression when closed
+	'''
+
+	def __init__(self, archive, path):
+		self.archive = archive
+		self.path = path
+		self.size = 0
+		self.f = io.open(path, 'wb', buffering=archive.buffer_bytes)
+
+	def write(self, data):
+		self.f.write(data)
+		self.size += len(data)
+
+	def close(self):
+		self.f.close()
+		self.archive._finished(self.path, self.size)
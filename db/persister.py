@@ -0,0 +1,101 @@
+""" Write-behind persistence of session records """
+
+import collections
+import logging
+import metrics
+import Queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+_FLUSH = object()
+
+_WRITE_SECONDS = metrics.histogram('stt_db_write_seconds',
+	'Time to commit one batch of session records')
+_BATCH_RECORDS = metrics.histogram('stt_db_batch_records',
+	'Session records per database commit', buckets=metrics.DEPTH_BUCKETS)
+_WRITE_ERRORS = metrics.counter('stt_db_write_errors_total',
+	'Records dropped after a database error')
+
+
+class Persister:
+	''' Takes session records off the response path and group-commits
+		them to a SessionStore from a background thread. A batch is
+		committed when `batch_size` tokens are pending or `interval`
+		seconds after its first record, whichever comes first. Only the
+		latest snapshot of a token is written per batch.
+	'''
+
+	def __init__(self, db, batch_size=64, interval=1.0):
+		self.db = db
+		self.batch_size = batch_size
+		self.interval = interval
+		self.queue = Queue.Queue()
+
+		self.thread = threading.Thread(target=self._run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def submit(self, record):
+		''' Queue a snapshot of record; never blocks on disk I/O '''
+		snapshot = dict(record)
+		snapshot['results'] = list(record['results'])
+		self.queue.put(snapshot)
+
+	def flush(self):
+		''' Block until everything submitted so far is committed '''
+		done = threading.Event()
+		self.queue.put((_FLUSH, done))
+		done.wait()
+
+	def close(self):
+		''' Commit pending records and stop the writer thread '''
+		self.queue.put(_STOP)
+		self.thread.join()
+
+	def _commit(self, pending):
+		if not pending:
+			return
+		start = time.time()
+		try:
+			self.db.put_many(pending.values())
+		except:
+			logger.exception('Database error: dropped %d records', len(pending))
+			_WRITE_ERRORS.inc(len(pending))
+		_WRITE_SECONDS.observe(time.time() - start)
+		_BATCH_RECORDS.observe(len(pending))
+		pending.clear()
+
+	def _run(self):
+		pending = collections.OrderedDict()
+		deadline = None
+
+		while True:
+			if pending:
+				timeout = max(0, deadline - time.time())
+			else:
+				timeout = None
+
+			try:
+				item = self.queue.get(timeout=timeout)
+			except Queue.Empty:
+				item = None
+
+			if item is _STOP:
+				self._commit(pending)
+				return
+
+			if isinstance(item, tuple) and item[0] is _FLUSH:
+				self._commit(pending)
+				item[1].set()
+				continue
+
+			if item is not None:
+				if not pending:
+					deadline = time.time() + self.interval
+				pending[item['token']] = item
+
+			if len(pending) >= self.batch_size or (pending and time.time() >= deadline):
+				self._commit(pending)
@@ -0,0 +1,205 @@
+""" Session stores for transcription records """
+
+import anydbm
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_BYTES = 64*1024*1024
+_SEGMENT_FORMAT = 'sessions-%06d.jsonl'
+_HIGHWATER = '__end__'
+
+
+def _key(token):
+	''' dbm key of a token: its utf8 bytes '''
+	if isinstance(token, unicode):
+		return token.encode('utf8')
+	return str(token)
+
+
+class SessionStore:
+	''' A session store keeps one record per token. put() replaces
+		the record for a token and get() returns the latest one or None.
+	'''
+
+	def put(self, record):
+		raise NotImplementedError()
+
+	def put_many(self, records):
+		for record in records:
+			self.put(record)
+
+	def get(self, token):
+		raise NotImplementedError()
+
+	def close(self):
+		pass
+
+
+class JsonlStore(SessionStore):
+	''' Append-only store: records are appended as JSON lines to
+		size-rolled segment files and a dbm index maps each token to the
+		segment and offset of its latest record. Writes cost one append
+		plus one index update, lookups read a single line, and opening
+		the store only re-indexes whatever was appended after the last
+		index high-water mark.
+	'''
+
+	def __init__(self, path, segment_bytes=_SEGMENT_BYTES):
+		self.path = path
+		self.segment_bytes = segment_bytes
+		self.lock = threading.Lock()
+
+		if not os.path.isdir(path):
+			os.makedirs(path)
+
+		self.index = anydbm.open(os.path.join(path, 'index'), 'c')
+
+		segments = sorted(f for f in os.listdir(path)
+			if f.startswith('sessions-') and f.endswith('.jsonl'))
+		if segments:
+			self.segment = int(segments[-1][len('sessions-'):-len('.jsonl')])
+		else:
+			self.segment = 1
+
+		self._recover()
+		self.f = open(self._segment_path(self.segment), 'ab')
+
+	def _segment_path(self, segment):
+		return os.path.join(self.path, _SEGMENT_FORMAT % segment)
+
+	def _recover(self):
+		''' Index records appended after the last synced high-water mark '''
+		if _HIGHWATER in self.index:
+			segment, offset = [int(x) for x in self.index[_HIGHWATER].split(':')]
+		else:
+			segment, offset = 1, 0
+
+		count = 0
+		while segment <= self.segment:
+			seg_path = self._segment_path(segment)
+			if os.path.exists(seg_path):
+				with open(seg_path, 'rb') as f:
+					f.seek(offset)
+					while True:
+						line = f.readline()
+						if not line.endswith('\n'):
+							break
+						try:
+							key = _key(json.loads(line)['token'])
+						except (ValueError, KeyError, TypeError):
+							logger.error('Skipping bad record in %s at %d', seg_path, offset)
+						else:
+							self.index[key] = '%d:%d' % (segment, offset)
+							count += 1
+						offset += len(line)
+			self.index[_HIGHWATER] = '%d:%d' % (segment, offset)
+			segment += 1
+			offset = 0
+
+		if count:
+			logger.info('Re-indexed %d session records', count)
+
+	def put(self, record):
+		key = _key(record['token'])
+		line = json.dumps(record, sort_keys=True) + '\n'
+		with self.lock:
+			offset = self.f.tell()
+			if offset and offset + len(line) > self.segment_bytes:
+				self.f.close()
+				self.segment += 1
+				self.f = open(self._segment_path(self.segment), 'ab')
+				offset = 0
+			self.f.write(line)
+			self.f.flush()
+			try:
+				self.index[key] = '%d:%d' % (self.segment, offset)
+				self.index[_HIGHWATER] = '%d:%d' % (self.segment, offset + len(line))
+			except:
+				# keep the segment in step with the index
+				self.f.truncate(offset)
+				raise
+
+	def get(self, token):
+		with self.lock:
+			loc = self.index.get(_key(token))
+		if loc is None:
+			return None
+		segment, offset = [int(x) for x in loc.split(':')]
+		with open(self._segment_path(segment), 'rb') as f:
+			f.seek(offset)
+			return json.loads(f.readline())
+
+	def close(self):
+		with self.lock:
+			self.f.close()
+			self.index.close()
+
+
+class SqliteStore(SessionStore):
+	''' SQLite store in WAL mode; the token is the primary key '''
+
+	def __init__(self, path):
+		if not os.path.isdir(path):
+			os.makedirs(path)
+		self.lock = threading.Lock()
+		self.conn = sqlite3.connect(os.path.join(path, 'sessions.db'),
+			check_same_thread=False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute('PRAGMA synchronous=NORMAL')
+		self.conn.execute('CREATE TABLE IF NOT EXISTS sessions '
+			'(token TEXT PRIMARY KEY, record TEXT NOT NULL)')
+		self.conn.commit()
+
+	def put(self, record):
+		self.put_many([record])
+
+	def put_many(self, records):
+		rows = [(record['token'], json.dumps(record, sort_keys=True)) for record in records]
+		with self.lock:
+			self.conn.executemany('INSERT OR REPLACE INTO sessions VALUES (?, ?)', rows)
+			self.conn.commit()
+
+	def get(self, token):
+		with self.lock:
+			row = self.conn.execute('SELECT record FROM sessions WHERE token = ?',
+				(token,)).fetchone()
+		return json.loads(row[0]) if row else None
+
+	def close(self):
+		with self.lock:
+			self.conn.close()
+
+
+_STORES = {'jsonl': JsonlStore, 'sqlite': SqliteStore}
+
+def open_store(kind, path):
+	''' Create the session store named `kind` under directory `path` '''
+	if kind not in _STORES:
+		raise Exception("Unknown session store: %s" % kind)
+	return _STORES[kind](path)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Inspect the session store')
+	parser.add_argument('-db', action='store', dest='db', default='jsonl',
+		choices=sorted(_STORES.keys()), help='store type')
+	parser.add_argument('-path', action='store', dest='path', default='log/sessions',
+		help='store directory')
+	parser.add_argument('-get', action='store', dest='token', help='print the record of a token')
+	parser.add_argument('-import', action='store', dest='legacy',
+		help='import records from an old log.json file')
+	args = parser.parse_args()
+
+	store = open_store(args.db, args.path)
+	if args.legacy:
+		with open(args.legacy) as f:
+			store.put_many(json.load(f).values())
+	if args.token:
+		print json.dumps(store.get(args.token), sort_keys=True, indent=4)
+	store.close()
@@ -0,0 +1,47 @@
+""" Local stand-ins for the cloud ASRs, for load and latency testing.
+
+start() serves a Google streaming_recognize gRPC service, an IBM
+websocket service and a Hound chunked-HTTP service on loopback ports and
+points asr.goog, asr.ibm and asr.hound at them, so the real client code
+(transport and parsing included) runs without cloud quota.
+"""
+
+import grpc
+import os
+
+import asr.goog as google
+import asr.hound as hound
+import asr.ibm as ibm
+
+import google_fake
+import hound_fake
+import ibm_fake
+from schedule import Schedule, Scheduler
+
+# dummy credentials accepted by the stand-ins
+_KEY_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# running stand-ins; a grpc server that is garbage collected stops serving
+servers = {}
+
+
+def start(schedule=None, host='127.0.0.1'):
+	''' Start the three stand-ins and configure the asr workers to use
+		them. The servers are kept in `servers`, keyed by asr name.
+	'''
+	if schedule is None:
+		schedule = Schedule()
+	scheduler = Scheduler()
+	scheduler.start()
+
+	servers['google'], port = google_fake.start(schedule, scheduler, host)
+	google.pool.configure(channel=grpc.insecure_channel('%s:%d' % (host, port)))
+
+	servers['ibm'], port = ibm_fake.start(schedule, scheduler, host)
+	ibm.URL = 'ws://%s:%d/speech-to-text/api/v1/recognize' % (host, port)
+	ibm.KEY_FILE = os.path.join(_KEY_PATH, 'ibm_key.json')
+
+	servers['hound'], port = hound_fake.start(schedule, scheduler, host)
+	hound.HOSTNAME = '%s:%d' % (host, port)
+	hound.USE_HTTPS = False
+	hound.KEY_FILE = os.path.join(_KEY_PATH, 'hound_key.json')
@@ -0,0 +1,59 @@
+""" Stand-in for the Google Cloud Speech streaming_recognize gRPC service """
+
+from concurrent import futures
+from google.cloud.proto.speech.v1 import cloud_speech_pb2 as speech_pb2
+from google.cloud.proto.speech.v1 import cloud_speech_pb2_grpc as speech_pb2_grpc
+import grpc
+import Queue
+import threading
+
+import schedule as timing
+
+_END = object()
+
+
+class FakeSpeech(speech_pb2_grpc.SpeechServicer):
+
+	def __init__(self, schedule, scheduler):
+		self.schedule = schedule
+		self.scheduler = scheduler
+
+	def _result(self, text, is_final):
+		alternative = speech_pb2.SpeechRecognitionAlternative(transcript=text,
+			confidence=0.9 if is_final else 0.0)
+		return speech_pb2.StreamingRecognizeResponse(results=[
+			speech_pb2.StreamingRecognitionResult(alternatives=[alternative],
+				is_final=is_final, stability=0.0 if is_final else 0.8)])
+
+	def StreamingRecognize(self, request_iterator, context):
+		responses = Queue.Queue()
+
+		def on_final(text):
+			responses.put(self._result(text, True))
+			responses.put(_END)
+
+		responder = timing.Responder(self.schedule, self.scheduler,
+			lambda text: responses.put(self._result(text, False)), on_final)
+
+		def read():
+			# the first request only carries the streaming config
+			for request in request_iterator:
+				if request.audio_content:
+					responder.audio(len(request.audio_content))
+			responder.end()
+
+		t = threading.Thread(target=read)
+		t.daemon = True
+		t.start()
+
+		for response in iter(responses.get, _END):
+			yield response
+
+
+def start(schedule, scheduler, host='127.0.0.1', workers=256):
+	''' Serve on an ephemeral loopback port; returns (server, port) '''
+	server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers))
+	speech_pb2_grpc.add_SpeechServicer_to_server(FakeSpeech(schedule, scheduler), server)
+	port = server.add_insecure_port('%s:0' % host)
+	server.start()
+	return server, port
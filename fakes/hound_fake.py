@@ -0,0 +1,91 @@
+""" Stand-in for the Houndify streaming audio endpoint (chunked HTTP) """
+
+import BaseHTTPServer
+import json
+import SocketServer
+import threading
+
+import schedule as timing
+
+# the client's last chunk; audio chunks may start with '{' as well
+_END_OF_AUDIO = json.dumps({'endOfAudio': True})
+
+
+class FakeHoundHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	''' Reads the chunked audio upload and streams newline delimited
+		JSON back on the same connection while audio is still arriving
+	'''
+
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format, *args):
+		pass
+
+	def _write(self, obj):
+		msg = json.dumps(obj)
+		if self.byte_count_prefix:
+			msg = '%d\n%s' % (len(msg), msg)
+		with self.lock:
+			if not self.done:
+				self.wfile.write(msg + '\n')
+
+	def _partial(self, text):
+		self._write({'Format': 'SoundHoundVoiceSearchParialTranscript',
+			'FormatVersion': '1.0', 'PartialTranscript': text,
+			'SafeToStopAudio': False, 'DurationNotSpeech': 0})
+
+	def _final(self, text):
+		self._write({'Format': 'SoundHoundVoiceSearchResult', 'FormatVersion': '1.0',
+			'Status': 'OK', 'NumToReturn': 1, 'ResultsAreFinal': [True],
+			'AllResults': [{'RawTranscription': text, 'FormattedTranscription': text,
+				'WrittenResponse': text, 'SpokenResponse': text}]})
+		with self.lock:
+			self.done = True
+		self.finished.set()
+
+	def do_POST(self):
+		info = json.loads(self.headers.get('Hound-Request-Info', '{}'))
+		self.byte_count_prefix = info.get('ObjectByteCountPrefix', False)
+		self.lock = threading.Lock()
+		self.done = False
+		self.finished = threading.Event()
+		responder = timing.Responder(self.server.schedule, self.server.scheduler,
+			self._partial, self._final)
+
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Connection', 'close')
+		self.end_headers()
+
+		header = True # the first chunk is the wav (or speex) header
+		while True:
+			size = int(self.rfile.readline().strip() or '0', 16)
+			if size == 0:
+				break
+			data = self.rfile.read(size)
+			self.rfile.readline()
+			if header:
+				header = False
+			elif data == _END_OF_AUDIO:
+				responder.end()
+			else:
+				responder.audio(len(data))
+
+		responder.end()
+		self.finished.wait()
+		self.close_connection = 1
+
+
+class FakeHoundServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+
+
+def start(schedule, scheduler, host='127.0.0.1'):
+	''' Serve on an ephemeral loopback port; returns (server, port) '''
+	server = FakeHoundServer((host, 0), FakeHoundHandler)
+	server.schedule = schedule
+	server.scheduler = scheduler
+	t = threading.Thread(target=server.serve_forever)
+	t.daemon = True
+	t.start()
+	return server, server.server_port
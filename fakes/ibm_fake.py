@@ -0,0 +1,59 @@
+""" Stand-in for the IBM Watson speech-to-text websocket service """
+
+from ws4py.server.wsgirefserver import WSGIServer, WebSocketWSGIRequestHandler
+from ws4py.server.wsgiutils import WebSocketWSGIApplication
+from ws4py.websocket import WebSocket
+from wsgiref.simple_server import make_server
+import json
+import threading
+
+import schedule as timing
+
+
+def _results(text, final):
+	return json.dumps({'result_index': 0, 'results': [
+		{'alternatives': [{'transcript': text}], 'final': final}]})
+
+
+def socket_class(schedule, scheduler):
+
+	class FakeRecognizeSocket(WebSocket):
+		''' Speaks the recognize protocol: a start action, binary audio,
+			an empty binary message at the end of audio
+		'''
+
+		def opened(self):
+			self.responder = timing.Responder(schedule, scheduler,
+				self._partial, self._final)
+
+		def _partial(self, text):
+			if not self.terminated:
+				self.send(_results(text, False))
+
+		def _final(self, text):
+			if not self.terminated:
+				self.send(_results(text, True))
+				self.send(json.dumps({'state': 'listening'}))
+
+		def received_message(self, message):
+			if message.is_binary:
+				if len(message.data):
+					self.responder.audio(len(message.data))
+				else:
+					self.responder.end()
+			elif json.loads(message.data.decode('utf8')).get('action') == 'start':
+				self.send(json.dumps({'state': 'listening'}))
+
+	return FakeRecognizeSocket
+
+
+def start(schedule, scheduler, host='127.0.0.1'):
+	''' Serve on an ephemeral loopback port; returns (server, port) '''
+	server = make_server(host, 0, server_class=WSGIServer,
+		handler_class=WebSocketWSGIRequestHandler,
+		app=WebSocketWSGIApplication(handler_cls=socket_class(schedule, scheduler)))
+	server.initialize_websockets_manager()
+	t = threading.Thread(target=server.serve_forever)
+	t.daemon = True
+	t.start()
+	return server, server.server_port
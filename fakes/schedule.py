@@ -0,0 +1,100 @@
+""" Response timing shared by the stand-in ASR backends """
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Schedule:
+	''' When a stand-in backend answers. A partial is due for every
+		`partial_ms` of audio received, `latency_ms` plus a uniform
+		random `jitter_ms` after that audio arrived; the final is due
+		`final_ms` (plus jitter) after the end of audio. Each partial
+		reveals one more word of `text`.
+	'''
+
+	def __init__(self, text='what is the weather there', partial_ms=200,
+			latency_ms=100, jitter_ms=50, final_ms=300, rate=16000):
+		self.words = text.split()
+		self.partial_ms = partial_ms
+		self.latency_ms = latency_ms
+		self.jitter_ms = jitter_ms
+		self.final_ms = final_ms
+		self.partial_bytes = max(1, 2*rate*partial_ms//1000)
+
+	def delay(self, base_ms):
+		return (base_ms + random.uniform(0, self.jitter_ms))/1000.0
+
+	def transcript(self, count=None):
+		if count is None:
+			count = len(self.words)
+		return ' '.join(self.words[:count])
+
+
+class Scheduler(threading.Thread):
+	''' One timer thread that runs the scheduled sends of every fake
+		session, so the stand-ins do not add a thread per session.
+	'''
+
+	def __init__(self):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.heap = []
+		self.counter = itertools.count()
+		self.cond = threading.Condition()
+
+	def call_at(self, due, fn, *args):
+		with self.cond:
+			heapq.heappush(self.heap, (due, next(self.counter), fn, args))
+			self.cond.notify()
+
+	def run(self):
+		while True:
+			with self.cond:
+				while not self.heap or self.heap[0][0] > time.time():
+					if self.heap:
+						self.cond.wait(self.heap[0][0] - time.time())
+					else:
+						self.cond.wait()
+				_, _, fn, args = heapq.heappop(self.heap)
+			try:
+				fn(*args)
+			except Exception:
+				logger.exception('stand-in send failed')
+
+
+class Responder:
+	''' Turns the audio a fake session receives into scheduled
+		on_partial(text) / on_final(text) calls, in order.
+	'''
+
+	def __init__(self, schedule, scheduler, on_partial, on_final):
+		self.schedule = schedule
+		self.scheduler = scheduler
+		self.on_partial = on_partial
+		self.on_final = on_final
+		self.received = 0
+		self.partials = 0
+		self.last_due = 0
+		self.ended = False
+
+	def _at(self, base_ms, fn, *args):
+		self.last_due = max(self.last_due, time.time() + self.schedule.delay(base_ms))
+		self.scheduler.call_at(self.last_due, fn, *args)
+
+	def audio(self, nbytes):
+		self.received += nbytes
+		while self.received >= (self.partials + 1)*self.schedule.partial_bytes:
+			self.partials += 1
+			self._at(self.schedule.latency_ms, self.on_partial,
+				self.schedule.transcript(self.partials))
+
+	def end(self):
+		if not self.ended:
+			self.ended = True
+			self._at(self.schedule.final_ms, self.on_final, self.schedule.transcript())
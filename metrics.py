@@ -0,0 +1,224 @@
+""" In-process metrics exposed in the Prometheus text format
+
+Counters, gauges and histograms are plain objects updated under a lock
+(one lock round trip per update, no allocation on the hot path once a
+labelled child exists). start_http_server() serves the registry on
+/metrics from a background thread.
+"""
+
+import bisect
+import BaseHTTPServer
+import logging
+import SocketServer
+import threading
+
+logger = logging.getLogger(__name__)
+
+# seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# items waiting in a queue
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _escape(value):
+	return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=()):
+	pairs = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+	pairs.extend('%s="%s"' % pair for pair in extra)
+	return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def _format_value(value):
+	if value == float('inf'):
+		return '+Inf'
+	return repr(float(value))
+
+
+class _Metric(object):
+	''' A metric family; with label names, labels(...) returns the child
+		for one combination of label values
+	'''
+
+	kind = None
+
+	def __init__(self, name, doc, labelnames=()):
+		self.name = name
+		self.doc = doc
+		self.labelnames = tuple(labelnames)
+		self.lock = threading.Lock()
+		self.children = {}
+
+	def labels(self, *values):
+		values = tuple(str(v) for v in values)
+		child = self.children.get(values)
+		if child is None:
+			with self.lock:
+				child = self.children.setdefault(values, self._child())
+		return child
+
+	def _samples(self):
+		''' (suffix, label values, extra labels, value) of every child '''
+		if not self.labelnames:
+			items = [((), self)]
+		else:
+			with self.lock:
+				items = sorted(self.children.items())
+		for values, child in items:
+			for suffix, extra, value in child._values():
+				yield suffix, values, extra, value
+
+	def expose(self):
+		lines = ['# HELP %s %s' % (self.name, self.doc), '# TYPE %s %s' % (self.name, self.kind)]
+		for suffix, values, extra, value in self._samples():
+			lines.append('%s%s%s %s' % (self.name, suffix,
+				_format_labels(self.labelnames, values, extra), _format_value(value)))
+		return '\n'.join(lines)
+
+
+class Counter(_Metric):
+	kind = 'counter'
+
+	def __init__(self, name, doc, labelnames=()):
+		_Metric.__init__(self, name, doc, labelnames)
+		self.value = 0
+
+	def _child(self):
+		return Counter(self.name, self.doc)
+
+	def inc(self, amount=1):
+		with self.lock:
+			self.value += amount
+
+	def _values(self):
+		return [('', (), self.value)]
+
+
+class Gauge(_Metric):
+	''' A value that goes up and down. With a function the value is
+		computed when the registry is scraped.
+	'''
+
+	kind = 'gauge'
+
+	def __init__(self, name, doc, labelnames=(), function=None):
+		_Metric.__init__(self, name, doc, labelnames)
+		self.value = 0
+		self.function = function
+
+	def _child(self):
+		return Gauge(self.name, self.doc)
+
+	def inc(self, amount=1):
+		with self.lock:
+			self.value += amount
+
+	def dec(self, amount=1):
+		with self.lock:
+			self.value -= amount
+
+	def set(self, value):
+		self.value = value
+
+	def _values(self):
+		if self.function is not None:
+			return [('', (), self.function())]
+		return [('', (), self.value)]
+
+
+class Histogram(_Metric):
+	kind = 'histogram'
+
+	def __init__(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+		_Metric.__init__(self, name, doc, labelnames)
+		self.buckets = tuple(buckets)
+		self.counts = [0]*(len(self.buckets) + 1)
+		self.sum = 0
+		self.count = 0
+
+	def _child(self):
+		return Histogram(self.name, self.doc, buckets=self.buckets)
+
+	def observe(self, value):
+		ix = bisect.bisect_left(self.buckets, value)
+		with self.lock:
+			self.counts[ix] += 1
+			self.sum += value
+			self.count += 1
+
+	def _values(self):
+		with self.lock:
+			counts = list(self.counts)
+			total, count = self.sum, self.count
+		out = []
+		cumulative = 0
+		for bound, n in zip(self.buckets + (float('inf'),), counts):
+			cumulative += n
+			out.append(('_bucket', (('le', _format_value(bound)),), cumulative))
+		out.append(('_sum', (), total))
+		out.append(('_count', (), count))
+		return out
+
+
+class Registry:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.metrics = {}
+
+	def register(self, metric):
+		''' Add metric, or return the one already registered under its name '''
+		with self.lock:
+			return self.metrics.setdefault(metric.name, metric)
+
+	def expose(self):
+		with self.lock:
+			metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+		return '\n'.join(m.expose() for m in metrics) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name, doc, labelnames=()):
+	return registry.register(Counter(name, doc, labelnames))
+
+
+def gauge(name, doc, labelnames=(), function=None):
+	return registry.register(Gauge(name, doc, labelnames, function))
+
+
+def histogram(name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+	return registry.register(Histogram(name, doc, labelnames, buckets))
+
+
+class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+	def log_message(self, format, *args):
+		pass
+
+	def do_GET(self):
+		if self.path.split('?')[0] not in ('/', '/metrics'):
+			self.send_error(404)
+			return
+		body = self.server.registry.expose()
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain; version=0.0.4')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+
+class _MetricsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+
+
+def start_http_server(port, host='127.0.0.1', registry=registry):
+	''' Serve registry on http://host:port/metrics; returns the server '''
+	server = _MetricsServer((host, port), _MetricsHandler)
+	server.registry = registry
+	t = threading.Thread(target=server.serve_forever)
+	t.daemon = True
+	t.start()
+	logger.info('Serving metrics on %s:%d', host, server.server_port)
+	return server
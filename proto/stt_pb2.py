@@ -19,7 +19,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   name='stt.proto',
   package='SpeechToText',
   syntax='proto3',
-  serialized_pb=_b('\n\tstt.proto\x12\x0cSpeechToText\"\xdc\x01\n\tConfigSTT\x12\x0c\n\x04\x61srs\x18\x01 \x03(\t\x12\x10\n\x08\x65ncoding\x18\x02 \x01(\t\x12\x15\n\rsampling_rate\x18\x03 \x01(\x05\x12\x10\n\x08language\x18\x04 \x01(\t\x12\x18\n\x10max_alternatives\x18\x05 \x01(\x05\x12\x18\n\x10profanity_filter\x18\x06 \x01(\x08\x12\x17\n\x0finterim_results\x18\x07 \x01(\x08\x12\x12\n\ncontinuous\x18\x08 \x01(\x08\x12\x11\n\tchunksize\x18\t \x01(\x05\x12\x12\n\ninactivity\x18\n \x01(\x05\"G\n\x0c\x43onfigResult\x12\x0e\n\x06status\x18\x01 \x01(\x08\x12\'\n\x06\x63onfig\x18\x02 \x01(\x0b\x32\x17.SpeechToText.ConfigSTT\"V\n\x0bSpeechChunk\x12\x0f\n\x07\x63ontent\x18\x01 \x01(\x0c\x12\r\n\x05token\x18\x02 \x01(\t\x12\'\n\x06\x63onfig\x18\x03 \x01(\x0b\x32\x17.SpeechToText.ConfigSTT\"X\n\x0fTranscriptChunk\x12\x0b\n\x03\x61sr\x18\x01 \x01(\t\x12\x12\n\ntranscript\x18\x02 \x01(\t\x12\x10\n\x08is_final\x18\x03 \x01(\x08\x12\x12\n\nconfidence\x18\x04 \x01(\x02\x32\x9f\x01\n\x08Listener\x12\x41\n\x08\x44oConfig\x12\x17.SpeechToText.ConfigSTT\x1a\x1a.SpeechToText.ConfigResult\"\x00\x12P\n\x0e\x44oSpeechToText\x12\x19.SpeechToText.SpeechChunk\x1a\x1d.SpeechToText.TranscriptChunk\"\x00(\x01\x30\x01\x62\x06proto3')
+  serialized_pb=_b('\n\tstt.proto\x12\x0cSpeechToText\"\xb8\x04\n\tConfigSTT\x12\x0c\n\x04\x61srs\x18\x01 \x03(\t\x12\x10\n\x08\x65ncoding\x18\x02 \x01(\t\x12\x15\n\rsampling_rate\x18\x03 \x01(\x05\x12\x10\n\x08language\x18\x04 \x01(\t\x12\x18\n\x10max_alternatives\x18\x05 \x01(\x05\x12\x18\n\x10profanity_filter\x18\x06 \x01(\x08\x12\x17\n\x0finterim_results\x18\x07 \x01(\x08\x12\x12\n\ncontinuous\x18\x08 \x01(\x08\x12\x11\n\tchunksize\x18\t \x01(\x05\x12\x12\n\ninactivity\x18\n \x01(\x05\x12\x12\n\ncompletion\x18\x0b \x01(\t\x12\x16\n\x0emin_confidence\x18\x0c \x01(\x02\x12\x13\n\x0bhedge_delay\x18\r \x01(\x05\x12\x18\n\x10interim_interval\x18\x0e \x01(\x05\x12\x19\n\x11\x64\x65lta_transcripts\x18\x0f \x01(\x08\x12\x10\n\x08\x63hannels\x18\x10 \x01(\x05\x12\x16\n\x0esilence_gating\x18\x11 \x01(\x08\x12\x14\n\x0cgate_preroll\x18\x12 \x01(\x05\x12\x15\n\rgate_hangover\x18\x13 \x01(\x05\x12\x18\n\x10\x66\x61st_endpointing\x18\x14 \x01(\x08\x12\x18\n\x10\x65ndpoint_silence\x18\x15 \x01(\x05\x12\x13\n\x0b\x66inal_grace\x18\x16 \x01(\x05\x12\x19\n\x11no_speech_timeout\x18\x17 \x01(\x05\x12\x10\n\x08longform\x18\x18 \x01(\x08\x12\x17\n\x0fsegment_seconds\x18\x19 \x01(\x05\"G\n\x0c\x43onfigResult\x12\x0e\n\x06status\x18\x01 \x01(\x08\x12\'\n\x06\x63onfig\x18\x02 \x01(\x0b\x32\x17.SpeechToText.ConfigSTT\"V\n\x0bSpeechChunk\x12\x0f\n\x07\x63ontent\x18\x01 \x01(\x0c\x12\r\n\x05token\x18\x02 \x01(\t\x12\'\n\x06\x63onfig\x18\x03 \x01(\x0b\x32\x17.SpeechToText.ConfigSTT\"o\n\x0fTranscriptChunk\x12\x0b\n\x03\x61sr\x18\x01 \x01(\t\x12\x12\n\ntranscript\x18\x02 \x01(\t\x12\x10\n\x08is_final\x18\x03 \x01(\x08\x12\x12\n\nconfidence\x18\x04 \x01(\x02\x12\x15\n\rprefix_length\x18\x05 \x01(\x05\x32\x9f\x01\n\x08Listener\x12\x41\n\x08\x44oConfig\x12\x17.SpeechToText.ConfigSTT\x1a\x1a.SpeechToText.ConfigResult\"\x00\x12P\n\x0e\x44oSpeechToText\x12\x19.SpeechToText.SpeechChunk\x1a\x1d.SpeechToText.TranscriptChunk\"\x00(\x01\x30\x01\x62\x06proto3')
 )
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
 
@@ -103,6 +103,111 @@ _CONFIGSTT = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='completion', full_name='SpeechToText.ConfigSTT.completion', index=10,
+      number=11, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='min_confidence', full_name='SpeechToText.ConfigSTT.min_confidence', index=11,
+      number=12, type=2, cpp_type=6, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='hedge_delay', full_name='SpeechToText.ConfigSTT.hedge_delay', index=12,
+      number=13, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='interim_interval', full_name='SpeechToText.ConfigSTT.interim_interval', index=13,
+      number=14, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='delta_transcripts', full_name='SpeechToText.ConfigSTT.delta_transcripts', index=14,
+      number=15, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='channels', full_name='SpeechToText.ConfigSTT.channels', index=15,
+      number=16, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='silence_gating', full_name='SpeechToText.ConfigSTT.silence_gating', index=16,
+      number=17, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='gate_preroll', full_name='SpeechToText.ConfigSTT.gate_preroll', index=17,
+      number=18, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='gate_hangover', full_name='SpeechToText.ConfigSTT.gate_hangover', index=18,
+      number=19, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='fast_endpointing', full_name='SpeechToText.ConfigSTT.fast_endpointing', index=19,
+      number=20, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='endpoint_silence', full_name='SpeechToText.ConfigSTT.endpoint_silence', index=20,
+      number=21, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='final_grace', full_name='SpeechToText.ConfigSTT.final_grace', index=21,
+      number=22, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='no_speech_timeout', full_name='SpeechToText.ConfigSTT.no_speech_timeout', index=22,
+      number=23, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='longform', full_name='SpeechToText.ConfigSTT.longform', index=23,
+      number=24, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='segment_seconds', full_name='SpeechToText.ConfigSTT.segment_seconds', index=24,
+      number=25, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -116,7 +221,7 @@ _CONFIGSTT = _descriptor.Descriptor(
   oneofs=[
   ],
   serialized_start=28,
-  serialized_end=248,
+  serialized_end=596,
 )
 
 
@@ -153,8 +258,8 @@ _CONFIGRESULT = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=250,
-  serialized_end=321,
+  serialized_start=598,
+  serialized_end=669,
 )
 
 
@@ -198,8 +303,8 @@ _SPEECHCHUNK = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=323,
-  serialized_end=409,
+  serialized_start=671,
+  serialized_end=757,
 )
 
 
@@ -238,6 +343,13 @@ _TRANSCRIPTCHUNK = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='prefix_length', full_name='SpeechToText.TranscriptChunk.prefix_length', index=4,
+      number=5, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -250,8 +362,8 @@ _TRANSCRIPTCHUNK = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=411,
-  serialized_end=499,
+  serialized_start=759,
+  serialized_end=870,
 )
 
 _CONFIGRESULT.fields_by_name['config'].message_type = _CONFIGSTT
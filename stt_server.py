@@ -5,11 +5,22 @@
 from proto import stt_pb2
 
 import argparse
+import asr.codec as codec
 import asr.goog as google
 import asr.hound as hound
 import asr.ibm as ibm
+import asr.longform as longform
+import asr.resample as resample
+import asr.ringbuffer as ringbuffer
+import asr.utils as utils
+import asr.vad as vad
+import db.archive as archive
+import db.persister as persister
+import db.store as store
+import fakes
 import itertools
 import json
+import metrics
 import os
 import Queue
 import random
@@ -17,8 +28,6 @@ import sys
 import thread
 import threading
 import time
-import webrtcvad
-import collections
 
 import argparse
 import sys
@@ -30,66 +39,195 @@ logger = logging.getLogger('SpeechToText')
 
 
 _SUPPORTED_ASRS = ["google", "hound", "ibm"]
-_LOG_PATH = 'log/'
-_LOG_FILE = 'log/log.json'
+_ASR_MODULES = {'google': google, 'hound': hound, 'ibm': ibm}
+# partials between two full transcripts with delta_transcripts
+_DELTA_SNAPSHOT_EVERY = 20
+_COMPLETION_POLICIES = ["", "all", "first_final", "confident_final"]
+# silence gating defaults (ms)
+_GATE_PREROLL = 300
+_GATE_HANGOVER = 300
+# fast endpointing defaults (ms)
+_ENDPOINT_SILENCE = 500
+_FINAL_GRACE = 250
+# continuous mode ends a stream without speech after (ms)
+_NO_SPEECH_TIMEOUT = 10000
+# long-form segments (s): rotated at the first pause after segment_seconds,
+# at the latest _SEGMENT_SLACK later, below the one minute cap of the backends
+_SEGMENT_SECONDS = 45
+_MAX_SEGMENT_SECONDS = 50
+_SEGMENT_SLACK = 5
+
+# queued by the hedge timer; looks like a partial to IterableQueue
+_HEDGE = {'is_final': False}
+# queued when the final_grace after a fast end of speech is over
+_PROMOTE = {'is_final': False}
+_DB_PATH = 'log/sessions'
+_AUDIO_PATH = 'log/audio'
+
+_SESSIONS = metrics.counter('stt_sessions_total', 'Speech to text sessions started')
+_ACTIVE_SESSIONS = metrics.gauge('stt_sessions_active', 'Sessions in progress')
+_SESSION_THREADS = metrics.gauge('stt_session_threads',
+	'Threads running for the sessions in progress')
+metrics.gauge('stt_process_threads', 'Threads of the server process',
+	function=threading.active_count)
+_SPLIT_DEPTH = metrics.histogram('stt_split_queue_depth',
+	'Audio chunks not yet read by the slowest consumer, per chunk received',
+	buckets=metrics.DEPTH_BUCKETS)
+_RESPONSE_DEPTH = metrics.histogram('stt_response_queue_depth',
+	'Responses waiting to be sent, per response sent', buckets=metrics.DEPTH_BUCKETS)
+_FIRST_PARTIAL = metrics.histogram('stt_asr_first_partial_seconds',
+	'Time from the start of a session to the first partial', ['asr'])
+_FINAL = metrics.histogram('stt_asr_final_seconds',
+	'Time from the start of a session to the final', ['asr'])
+_VAD_SESSIONS = metrics.counter('stt_vad_sessions_total', 'Sessions endpointed by the server VAD')
+_VAD_EVENTS = metrics.counter('stt_vad_events_total', 'Server VAD events', ['event'])
+_ARCHIVE_BYTES = metrics.counter('stt_archive_bytes_total', 'Audio bytes written to the archive')
+_ARCHIVE_ERRORS = metrics.counter('stt_archive_errors_total', 'Sessions whose audio was not archived')
+_HEDGES = metrics.counter('stt_asr_hedges_total',
+	'Secondary asrs started because the primary was slow to respond', ['asr'])
+_PARTIALS_DROPPED = metrics.counter('stt_partials_dropped_total',
+	'Partials not sent to the client', ['asr', 'reason'])
+_AUDIO_SECONDS = metrics.counter('stt_audio_seconds_total',
+	'Seconds of audio received from clients and passed on to the asrs', ['stream'])
+_PROMOTED = metrics.counter('stt_partials_promoted_total',
+	'Last partials sent as the final of an asr that missed the final grace', ['asr'])
+_CANCELLED = metrics.counter('stt_asr_cancelled_total',
+	'Backend streams cancelled after another asr completed the session', ['asr'])
+
+def _spawn(target, *args):
+	''' Start a session thread, counted in stt_session_threads '''
+	def run():
+		_SESSION_THREADS.inc()
+		try:
+			target(*args)
+		finally:
+			_SESSION_THREADS.dec()
+	t = threading.Thread(target=run)
+	t.start()
+	return t
 
 class IterableQueue():
 	''' An iterator over queue data structure that
-		stops when the predicate is false
+		stops when the predicate is false. Partials of an asr are passed
+		on at most once per `interval` seconds: a newer partial replaces
+		the one held back and a final goes out at once, dropping it.
+		Whatever an asr sends after its final is dropped.
 	'''
-	def __init__(self, Q, num_asrs):
+	def __init__(self, Q, num_asrs, interval=0):
 		self.Q = Q
-		self.endcount = 0
+		self.finished = set() # asrs whose final was passed on
 		self.num_asrs = num_asrs
 		self.predicate = True
+		self.interval = interval
+		self.held = {} # asr -> partial held back
+		self.next_send = {} # asr -> earliest time of its next partial
 
 	def __iter__(self):
 		return self
 
 	def _check(self, x):
 		if x['is_final'] == True:
-			self.endcount += 1
+			self.finished.add(x['asr'])
 
-		if self.endcount == self.num_asrs:
+		if len(self.finished) == self.num_asrs:
 			self.predicate = False
 
-	def next(self):
-		if self.predicate:
-			item = self.Q.get()
-			self._check(item)
-			return item
-		else:
-			raise StopIteration
+	def _due(self, now):
+		for asr, item in self.held.items():
+			if self.next_send[asr] <= now:
+				del self.held[asr]
+				self.next_send[asr] = now + self.interval
+				return item
+		return None
 
-def LogStream(chunkIterator, token):
+	def next(self):
+		while self.predicate:
+			item = self._due(time.time())
+			if item is not None:
+				return item
+
+			if self.held:
+				timeout = min(self.next_send[asr] for asr in self.held) - time.time()
+				try:
+					item = self.Q.get(timeout=max(timeout, 0))
+				except Queue.Empty:
+					continue
+			else:
+				item = self.Q.get()
+
+			asr = item.get('asr')
+			if asr in self.finished:
+				continue
+			if item['is_final'] or asr is None or not self.interval:
+				if self.held.pop(asr, None) is not None:
+					_PARTIALS_DROPPED.labels(asr, 'rate').inc()
+				self._check(item)
+				return item
+
+			now = time.time()
+			if now >= self.next_send.get(asr, 0):
+				self.next_send[asr] = now + self.interval
+				return item
+			if asr in self.held:
+				_PARTIALS_DROPPED.labels(asr, 'rate').inc()
+			self.held[asr] = item
+
+		raise StopIteration
+
+def _completes(config, item):
+	''' True if the final item ends the session under the completion policy '''
+	if not item['transcript']:
+		return False
+	if config['completion'] == 'first_final':
+		return True
+	if config['completion'] == 'confident_final':
+		return item['confidence'] >= config['min_confidence']
+	return False
+
+def LogStream(chunkIterator, token, audio_archive):
 	try:
-		with open('%s/%s.raw'%(_LOG_PATH, token), 'wb') as f:
+		f = audio_archive.open(token)
+		try:
 			for chunk in chunkIterator:
 				f.write(chunk)
-	except:
-		logger.error('cannot write speech file')
+				_ARCHIVE_BYTES.inc(len(chunk))
+		finally:
+			f.close()
+	except EnvironmentError as e:
+		logger.error('%s: cannot write speech file: %s', token, e)
+		_ARCHIVE_ERRORS.inc()
+	finally:
+		chunkIterator.close()
 
 
 class Listener(stt_pb2.BetaListenerServicer):
 
-	def __init__(self):
+	def __init__(self, db_type='jsonl', db_batch=64, db_interval=1.0,
+			archive_codec='gzip', archive_quota=0, archive_days=0, codecs=None):
 		""" put initializaiton code e.g. db access """
 
+		# encoding of the audio sent to each asr (default LINEAR16)
+		self.codecs = {}
+		for asr, encoding in (codecs or {}).items():
+			if encoding not in codec.SUPPORTED[asr]:
+				raise Exception("%s does not accept %s audio" % (asr, encoding))
+			if not codec.available(encoding):
+				logger.error('No %s encoder, sending LINEAR16 to %s', encoding, asr)
+				continue
+			self.codecs[asr] = encoding
+
+		self.archive = archive.AudioArchive(_AUDIO_PATH, archive_codec,
+			max_bytes=archive_quota*1024*1024, max_age=archive_days*86400)
+
 		self.db_type = None
-		self.db = {}
+		self.db = None
 
-		# see if log/ can be used as a database
+		# session records live in an append-only store under log/
 		try:
-			f = open(_LOG_FILE)
-			try:
-				self.db = json.load(f)
-				self.db_type = 'log'
-				logger.info('Selecting log database')
-			except ValueError as e:
-				logger.error("'" + _LOG_FILE + "' is not a valid JSON file.")
-			finally:
-				f.close()
-
+			self.db = store.open_store(db_type, _DB_PATH)
+			self.db_type = db_type
+			self.persister = persister.Persister(self.db, db_batch, db_interval)
+			logger.info('Selecting %s database', db_type)
 		except EnvironmentError as e:
 			logger.error('Cannot establish database connection')
 
@@ -97,119 +235,238 @@ class Listener(stt_pb2.BetaListenerServicer):
 
 	def _write_to_database(self, record):
 
-		if self.db_type == 'log':
-			# add record to the dictionary
-			self.db.update({record['token']: record})
-			with open(_LOG_FILE, 'w') as f:
-				json.dump(self.db, f,  sort_keys=True, indent=4)
+		if self.db is not None:
+			self.persister.submit(record)
 		else:
 			logger.error("Cannot write to DB")
 
-
-	def _splitStream(self, request_iterator, listQueues, config):
-		''' Place the items from the request_iterator into each
-			queue in the list of queues. When using VAD (continuous
-			= True), the end-of-speech (EOS) can occur when the
-			stream ends or inactivity is detected, whichever occurs
-			first.
+	def close(self):
+		''' flush pending records and audio on shutdown '''
+		if self.db is not None:
+			self.persister.close()
+			self.db.close()
+		self.archive.close()
+
+	def _splitStream(self, request_iterator, ring, config, stats, archive_ring=None,
+			endpointed=None):
+		''' Write the items from the request_iterator into the shared
+			audio ring buffer read by every consumer. When using VAD
+			(continuous = True), the end-of-speech (EOS) can occur when
+			the stream ends, inactivity is detected (over a window that
+			adapts to the speaker) or no speech started within the
+			no_speech_timeout, whichever occurs first. Compressed input
+			is decoded to PCM first, by a decoder process per session,
+			then converted to 16 kHz mono if it was sent at another rate
+			or with more channels.
+
+			With silence_gating only the voiced audio reaches the ring
+			(and so the asrs); the complete audio goes to archive_ring.
+			In single-utterance mode without fast_endpointing only the
+			leading silence is dropped, as the asrs endpoint on the
+			trailing one. The seconds received and passed on are kept in
+			stats.
+
+			With fast_endpointing (in either mode) the stream to the asrs
+			ends after a short, adaptive trailing silence, and endpointed()
+			is called.
+
+			The audio is framed and run through webrtcvad once; the
+			end-pointers and the gate take their decisions per frame.
+			In continuous mode every chunk is written to the ring marked
+			with the pause (ms) the speaker is in, for long-form
+			segmentation.
 		'''
 		continuous = config['continuous']
+		bytes_per_second = 2.0*config['sampling_rate']
+
+		audio = (chunk.content for chunk in request_iterator)
+		if config['input_encoding'] != 'LINEAR16':
+			audio = codec.decode(audio, config['input_encoding'], config['input_rate'],
+				config['channels'])
+		if config['input_rate'] != config['sampling_rate'] or config['channels'] > 1:
+			audio = resample.convert(audio, config['input_rate'], config['channels'],
+				config['sampling_rate'])
 
+		endpointer = None
 		if continuous:
-			frame_len = 10 #10ms or 20ms or 30ms
-			frame_bytes = 32*frame_len #16KHz sampling @ 2Bytes/sample
-
-			# number of frames
-			inactivity_frames = config['inactivity']//frame_len
-			vad = webrtcvad.Vad()
-			vad.set_mode(3)
-			ring_buffer = collections.deque(maxlen=inactivity_frames)
-			triggered = False
-			end_of_speech = False
-			prev_content = b''
+			endpointer = vad.Endpointer(config['inactivity'],
+				no_speech=config['no_speech_timeout'])
+			_VAD_SESSIONS.inc()
+
+		fast = None
+		if config['fast_endpointing']:
+			fast = vad.FastEndpointer(config['endpoint_silence'])
+
+		gate = None
+		if config['silence_gating']:
+			gate = vad.Gate(config['gate_preroll'], config['gate_hangover'],
+				config['sampling_rate'],
+				reclose=continuous or config['fast_endpointing'])
+
+		frames = None
+		if endpointer is not None or fast is not None or gate is not None:
+			frames = vad.Frames(config['sampling_rate'])
 
 		counter = 0
+		received = upstream = 0
 
-		for chunk in request_iterator:
+		for data in audio:
 
 			counter += 1
-			# we have to use custom VAD otherwise
-			# we let the ASRs use their VAD for non-continuous
-			if continuous:
-
-				# break chunk into 10ms frames
-				curr_content = prev_content + chunk.content
-				n = len(curr_content)
-				offset = 0
-
-				while n >= frame_bytes:
-					# webrtc takes chunks of only 10ms/20ms/30ms. We use 16KHz@10ms.
-					is_speech = vad.is_speech(curr_content[offset:offset+frame_bytes], 16000)
-					ring_buffer.append(is_speech)
-					n = n - frame_bytes
-					offset += frame_bytes
-
-				if n > 0:
-					prev_content = curr_content[offset:]
-				else:
-					prev_content = b''
-
-				# number of voiced and unvoiced segments
-				num_voiced = len([f for f in ring_buffer if f is True])
-				num_unvoiced = len(ring_buffer) - num_voiced
-
-				# logger.info("%d, %d", num_voiced, num_unvoiced)
-
-				# TODO: if not triggered for a while then go to end-of-speech
-				# in any case
-				if not triggered:
-					if num_voiced > 0.5*ring_buffer.maxlen:
-						triggered = True
-						logger.info('Triggered start of speech')
-				else:
-					if num_unvoiced > 0.9*ring_buffer.maxlen:
-						end_of_speech = True
-
-				if end_of_speech:
-					logger.info('Got end of speech from VAD')
-					for Q in listQueues:
-						# logger.info('adding end of speech')
-						Q.put('EOS')
+			for frame, voiced in (frames.process(data) if frames is not None else ()):
+				# we have to use custom VAD otherwise
+				# we let the ASRs use their VAD for non-continuous
+				event = endpointer.push(frame, voiced) if continuous else None
+				if event == vad.START_OF_SPEECH:
+					logger.info('Triggered start of speech')
+					_VAD_EVENTS.labels('start_of_speech').inc()
+
+				elif event == vad.END_OF_SPEECH:
+					logger.info('Got end of speech from VAD after %d ms of silence',
+						endpointer.silence)
+					_VAD_EVENTS.labels('end_of_speech').inc()
+					ring.close()
 					continuous = False
 
+				elif event == vad.NO_SPEECH:
+					logger.info('No speech for %d ms, ending the stream',
+						config['no_speech_timeout'])
+					_VAD_EVENTS.labels('no_speech').inc()
+					ring.close()
+					continuous = False
 
-			for Q in listQueues:
-				Q.put(chunk.content)
-
-		for Q in listQueues:
-			# logger.info('adding end of speech')
-			Q.put('EOS')
-
-	def _mergeStream(self, asr_response_iterator, responseQueue, asr):
+				if fast is not None and not ring.closed:
+					if fast.push(voiced) == vad.END_OF_SPEECH:
+						logger.info('Fast end of speech after %d ms of silence', fast.hangover)
+						_VAD_EVENTS.labels('fast_end_of_speech').inc()
+						ring.close()
+						if endpointed is not None:
+							endpointed()
+
+				if gate is not None:
+					gate.push(frame, voiced)
+
+			received += len(data)
+			stats['received_seconds'] = received/bytes_per_second
+			if archive_ring is not None:
+				archive_ring.write(data)
+			if gate is not None:
+				data = gate.take()
+				if not data:
+					continue
+
+			if not ring.closed:
+				upstream += len(data)
+				stats['upstream_seconds'] = upstream/bytes_per_second
+			ring.write(data, endpointer.pause_ms if continuous else None)
+			_SPLIT_DEPTH.observe(ring.depth())
+
+		if gate is not None and not ring.closed:
+			data = gate.flush(frames.flush())
+			if data:
+				upstream += len(data)
+				stats['upstream_seconds'] = upstream/bytes_per_second
+				ring.write(data)
+			logger.info('Silence gating passed on %d of %d bytes in %d segments',
+				upstream, received, gate.segments)
+
+		ring.close()
+		if archive_ring is not None:
+			archive_ring.close()
+		_AUDIO_SECONDS.labels('received').inc(received/bytes_per_second)
+		_AUDIO_SECONDS.labels('upstream').inc(upstream/bytes_per_second)
+
+	def _mergeStream(self, asr_response_iterator, responseQueue, asr, cursor, start):
 		''' Place the item from the asr_response_iterator of asr into a common
-			queue called responseQueue
+			queue called responseQueue. The audio cursor is released once
+			the asr is done so it no longer holds back the ring buffer.
+			start is the session start time for the latency metrics.
 		'''
+		first_partial = _FIRST_PARTIAL.labels(asr)
+		final = _FINAL.labels(asr)
+		duplicates = _PARTIALS_DROPPED.labels(asr, 'duplicate')
+		last_partial = None
 
 		for asr_response in asr_response_iterator:
 			str_response = asr_response['transcript']
 			is_final = asr_response['is_final']
+			if is_final:
+				final.observe(time.time() - start)
+			else:
+				# backends repeat a partial until the text changes
+				if str_response == last_partial:
+					duplicates.inc()
+					continue
+				last_partial = str_response
+				if first_partial is not None and str_response:
+					first_partial.observe(time.time() - start)
+					first_partial = None
 			toClient_json = {'asr': asr, 'transcript': str_response,
-								'is_final': is_final}
+								'is_final': is_final,
+								'confidence': asr_response.get('confidence', -1)}
 			responseQueue.put(toClient_json)
+		cursor.close()
 		# logger.info('merge thread complete')
 		return
 
+	def _startAsr(self, asr, token, config, cursor, responseQueue, start):
+		''' Run asr on the audio of cursor in its own thread, merging its
+			responses into responseQueue; returns the worker
+		'''
+		chunks = cursor
+		encode = None
+		encoding = self.codecs.get(asr, 'LINEAR16')
+		if encoding != 'LINEAR16':
+			config = dict(config, encoding=encoding)
+			if codec.external(encoding):
+				encode = lambda audio: codec.encode(audio, encoding, config['sampling_rate'])
+
+		if config['longform']:
+			# a new backend stream per segment, each encoded on its own
+			# segments end at the pauses the session VAD marks in the ring
+			w = longform.worker(_ASR_MODULES[asr], token, asr, config['segment_seconds'],
+				config['segment_seconds'] + _SEGMENT_SLACK, rate=config['sampling_rate'],
+				encode=encode, pause=lambda: cursor.mark or 0)
+		else:
+			if encode is not None:
+				# closing the encoded stream also closes the cursor
+				chunks = encode(cursor)
+			w = _ASR_MODULES[asr].worker(token)
+		_spawn(self._mergeStream, w.stream(chunks, config), responseQueue, asr, chunks, start)
+		return w
+
 	def DoConfig(self, request, context):
 
 		if set(request.asrs) > set(_SUPPORTED_ASRS):
 			raise Exception("STT not supported")
 
-		if request.encoding != 'LINEAR16':
+		if not codec.decodable(request.encoding):
 			raise Exception("encoding not supported")
 
-		if request.sampling_rate != 16000:
+		if request.sampling_rate not in resample.RATES:
 			raise Exception("Rate not supported")
 
+		if request.channels not in (0, 1, 2):
+			raise Exception("only mono or stereo audio is supported")
+
+		if request.completion not in _COMPLETION_POLICIES:
+			raise Exception("completion policy not supported")
+
+		if request.hedge_delay < 0:
+			raise Exception("hedge delay must not be negative")
+
+		if request.interim_interval < 0:
+			raise Exception("interim interval must not be negative")
+
+		if request.gate_preroll < 0 or request.gate_hangover < 0:
+			raise Exception("silence gating times must not be negative")
+
+		if request.endpoint_silence < 0 or request.final_grace < 0 or request.no_speech_timeout < 0:
+			raise Exception("endpointing times must not be negative")
+
+		if not 0 <= request.segment_seconds <= _MAX_SEGMENT_SECONDS:
+			raise Exception("segment_seconds must be between 0 and %d" % _MAX_SEGMENT_SECONDS)
+
 		logger.info('STT configuration done')
 		return stt_pb2.ConfigResult(status=True,
 			config=request)
@@ -219,7 +476,17 @@ class Listener(stt_pb2.BetaListenerServicer):
 		   Takes in a stream of stt_pb2 SpeechChunk messages
 		   and returns a stream of stt_pb2 Transcript messages
 		'''
+		_SESSIONS.inc()
+		_ACTIVE_SESSIONS.inc()
+		try:
+			for response in self._doSpeechToText(request_iterator, context):
+				yield response
+		finally:
+			_ACTIVE_SESSIONS.dec()
+
+	def _doSpeechToText(self, request_iterator, context):
 
+		start = time.time()
 		# first item in iterator has the config and token
 		first_item = next(request_iterator)
 
@@ -231,8 +498,13 @@ class Listener(stt_pb2.BetaListenerServicer):
 
 		config = {}
 		config['asrs'] = stt_config.asrs
-		config['encoding'] = stt_config.encoding
-		config['sampling_rate'] = stt_config.sampling_rate
+		# client audio is decoded on ingest; the asrs get PCM (or their -*-codec)
+		config['input_encoding'] = stt_config.encoding
+		config['encoding'] = 'LINEAR16'
+		# the audio is resampled on ingest, the asrs always get 16 kHz mono
+		config['input_rate'] = stt_config.sampling_rate
+		config['channels'] = stt_config.channels or 1
+		config['sampling_rate'] = resample.NATIVE_RATE
 		config['language'] = stt_config.language
 		config['max_alternatives'] = stt_config.max_alternatives
 		config['profanity_filter'] = stt_config.profanity_filter
@@ -240,56 +512,110 @@ class Listener(stt_pb2.BetaListenerServicer):
 		config['continuous'] = stt_config.continuous
 		config['chunksize'] = stt_config.chunksize
 		config['inactivity'] = stt_config.inactivity
+		config['completion'] = stt_config.completion or 'all'
+		config['min_confidence'] = stt_config.min_confidence
+		config['hedge_delay'] = stt_config.hedge_delay
+		config['interim_interval'] = stt_config.interim_interval
+		config['delta_transcripts'] = stt_config.delta_transcripts
+		config['silence_gating'] = stt_config.silence_gating
+		config['gate_preroll'] = stt_config.gate_preroll or _GATE_PREROLL
+		config['gate_hangover'] = stt_config.gate_hangover or _GATE_HANGOVER
+		config['fast_endpointing'] = stt_config.fast_endpointing
+		config['endpoint_silence'] = stt_config.endpoint_silence or _ENDPOINT_SILENCE
+		config['final_grace'] = stt_config.final_grace or _FINAL_GRACE
+		config['no_speech_timeout'] = stt_config.no_speech_timeout or _NO_SPEECH_TIMEOUT
+		config['longform'] = stt_config.longform and stt_config.continuous
+		config['segment_seconds'] = stt_config.segment_seconds or _SEGMENT_SECONDS
 
 		record = {}
 		record['token'] = token
 		record['results'] = []
+		# seconds of audio received and passed on to the asrs
+		stats = {'received_seconds': 0.0, 'upstream_seconds': 0.0}
 
-		all_queues = []
-		for _ in range(len(config['asrs'])):
-			all_queues.append(Queue.Queue())
-		# additional queue for log stream
-		all_queues.append(Queue.Queue())
+		# with hedging only the first asr (the primary) starts right away
+		if config['hedge_delay'] > 0:
+			active = list(config['asrs'][:1])
+		else:
+			active = list(config['asrs'])
+
+		# one cursor per asr plus one for the log stream; with silence
+		# gating the log stream reads the ungated audio from its own ring
+		ring = ringbuffer.AudioRingBuffer()
+		cursors = dict((asr, ring.reader()) for asr in active)
+		archive_ring = None
+		if config['silence_gating']:
+			archive_ring = ringbuffer.AudioRingBuffer()
+			log_cursor = archive_ring.reader()
+		else:
+			log_cursor = ring.reader()
 
 		logger.debug('%s: Running speech to text', token)
 
 		thread_ids = []
+		responseQueue = Queue.Queue()
 
-		t = threading.Thread(target=self._splitStream, args=(request_iterator, all_queues, config))
-		t.start()
-		thread_ids.append(t)
-		t = threading.Thread(target=LogStream, args=(iter(all_queues[-1].get, 'EOS'), token))
-		t.start()
-		thread_ids.append(t)
+		# after a fast end of speech the asrs get final_grace ms to send
+		# their final before their last partial is sent as the final
+		def endpointed():
+			t = threading.Timer(config['final_grace']/1000.0, responseQueue.put, [_PROMOTE])
+			t.daemon = True
+			t.start()
 
-		responseQueue = Queue.Queue()
-		for ix, asr in enumerate(config['asrs']):
-			if asr == 'google':
-				gw = google.worker(token)
-				t = threading.Thread(target=self._mergeStream, args=
-					(gw.stream(iter(all_queues[ix].get, 'EOS'), config),
-						responseQueue, asr))
-				t.start()
-				thread_ids.append(t)
-
-			if asr == 'ibm':
-				ibmw = ibm.worker(token)
-				t = threading.Thread(target=self._mergeStream, args=
-					(ibmw.stream(iter(all_queues[ix].get, 'EOS'), config),
-						responseQueue, asr))
-				t.start()
-				thread_ids.append(t)
-
-			if asr == 'hound':
-				houndw = hound.worker(token)
-				t = threading.Thread(target=self._mergeStream, args=
-					(houndw.stream(iter(all_queues[ix].get, 'EOS'), config),
-						responseQueue, asr))
-				t.start()
-				thread_ids.append(t)
+		thread_ids.append(_spawn(self._splitStream, request_iterator, ring, config, stats,
+			archive_ring, endpointed))
+		thread_ids.append(_spawn(LogStream, log_cursor, token, self.archive))
+
+		workers = {}
+		for asr in active:
+			workers[asr] = self._startAsr(asr, token, config, cursors[asr], responseQueue, start)
+
+		hedge_timer = None
+		if len(active) < len(config['asrs']):
+			hedge_timer = threading.Timer(config['hedge_delay']/1000.0, responseQueue.put, [_HEDGE])
+			hedge_timer.start()
 
 		# keep sending transcript to client until *all* ASRs are DONE
-		for item_json in IterableQueue(responseQueue, len(config['asrs'])):
+		# (or one final completes the session, see ConfigSTT.completion)
+		finished = set()
+		encoders = {}
+		last_text = {} # latest partial of each asr passed on
+		responses = IterableQueue(responseQueue, len(active), config['interim_interval']/1000.0)
+		for item_json in responses:
+			if item_json is _HEDGE:
+				if hedge_timer is not None:
+					# the primary is slow: start the others on the audio so far
+					hedge_timer = None
+					for asr in config['asrs'][1:]:
+						logger.info('%s: hedging with %s', token, asr)
+						cursors[asr] = ring.reader(replay=True)
+						workers[asr] = self._startAsr(asr, token, config, cursors[asr],
+							responseQueue, start)
+						_HEDGES.labels(asr).inc()
+					responses.num_asrs = len(workers)
+				continue
+
+			if item_json is _PROMOTE:
+				for asr in workers:
+					if asr in finished:
+						continue
+					held = responses.held.get(asr)
+					text = held['transcript'] if held is not None else last_text.get(asr)
+					if text:
+						logger.info('%s: no final from %s in time, promoting its partial',
+							token, asr)
+						responseQueue.put({'asr': asr, 'transcript': text, 'is_final': True,
+							'confidence': -1, 'promoted': True})
+				continue
+
+			if hedge_timer is not None and (item_json['is_final'] or item_json['transcript']):
+				# the primary responded in time; an empty partial only
+				# shows its stream is open
+				hedge_timer.cancel()
+				hedge_timer = None
+
+			_RESPONSE_DEPTH.observe(responseQueue.qsize())
+			completed = False
 
 			# logger.info(item_json)
 			if item_json['is_final']:
@@ -298,42 +624,138 @@ class Listener(stt_pb2.BetaListenerServicer):
 				each_record['asr'] = item_json['asr']
 				each_record['transcript'] = item_json['transcript']
 				each_record['is_final'] = item_json['is_final']
-				each_record['confidence'] = 1.0
+				each_record['confidence'] = item_json['confidence']
 				record['results'].append(each_record)
+				finished.add(item_json['asr'])
+				completed = _completes(config, item_json)
+				# and the seconds each asr was sent so far, i.e. billed
+				record['audio'] = dict(stats, billed_seconds=dict(
+					(asr, cursors[asr].bytes/(2.0*config['sampling_rate'])) for asr in cursors))
+
+				if item_json.get('promoted'):
+					# its own final would only be dropped now
+					asr = item_json['asr']
+					cursors[asr].close()
+					workers[asr].cancel()
+					_PROMOTED.labels(asr).inc()
+
+				# write each result as it arrives because the client
+				# may break the call after just one ASR finishes
+				try:
+					self._write_to_database(record)
+				except:
+					e = sys.exc_info()[0]
+					logger.error('%s: Database error: %s', token, e)
 
 				# WE DONOT JOIN
 				# for t in thread_ids:
 				# 	t.join()
+			else:
+				last_text[item_json['asr']] = item_json['transcript']
+
+			transcript, prefix_length = item_json['transcript'], 0
+			if config['delta_transcripts']:
+				if item_json['asr'] not in encoders:
+					encoders[item_json['asr']] = utils.DeltaEncoder(_DELTA_SNAPSHOT_EVERY)
+				# finals always carry the full text
+				prefix_length, transcript = encoders[item_json['asr']].encode(transcript,
+					snapshot=item_json['is_final'])
 
-			#TODO: write each record to DB separately because the client
-			#may break the call after just one ASR finishes
 			yield stt_pb2.TranscriptChunk(
 				asr = item_json['asr'],
-				transcript = item_json['transcript'],
+				transcript = transcript,
 				is_final = item_json['is_final'],
-				confidence = 1.0,
+				confidence = item_json['confidence'],
+				prefix_length = prefix_length,
 				)
 
-		try:
-			self._write_to_database(record)
-		except:
-			e = sys.exc_info()[0]
-			logger.error('%s: Database error: %s', token, e)
+			if completed:
+				logger.info('%s: completed by %s', token, item_json['asr'])
+				for asr in workers:
+					if asr not in finished:
+						cursors[asr].close()
+						workers[asr].cancel()
+						_CANCELLED.labels(asr).inc()
+				break
 
 
-def serve(port):
-	server = stt_pb2.beta_create_Listener_server(Listener())
-	server.add_insecure_port('[::]:%d'%port)
+def serve(args):
+	if args.fake_asrs:
+		fakes.start(fakes.Schedule(partial_ms=args.fake_partial, latency_ms=args.fake_latency,
+			jitter_ms=args.fake_jitter, final_ms=args.fake_final))
+		logger.info('Using local stand-in ASRs')
+
+	if args.metrics_port:
+		metrics.start_http_server(args.metrics_port, args.metrics_host)
+
+	hound.COALESCE_MS = args.hound_coalesce
+	google.pool.configure(size=args.google_pool, streams=args.google_streams,
+		idle=args.google_idle)
+	try:
+		google.pool.warm()
+	except:
+		logger.error('Cannot pre-open google client: %s', sys.exc_info()[0])
+
+	codecs = {'google': args.google_codec, 'ibm': args.ibm_codec, 'hound': args.hound_codec}
+	listener = Listener(args.db_type, args.db_batch, args.db_interval,
+		args.archive_codec, args.archive_quota, args.archive_days, codecs)
+	server = stt_pb2.beta_create_Listener_server(listener, pool_size=args.workers)
+	server.add_insecure_port('[::]:%d'%args.port)
 	server.start()
 	try:
 		while True:
 			time.sleep(1000)
 	except KeyboardInterrupt:
 		server.stop(0)
+		listener.close()
 
-if __name__ == '__main__':
-	parser = argparse.ArgumentParser(description='SpeechToText service')
+def parse_args(description='SpeechToText service'):
+	parser = argparse.ArgumentParser(description=description)
 	parser.add_argument('-p', action='store', dest='port', type=int, default=9080,
 		help='port')
-	args = parser.parse_args()
-	serve(args.port)
+	parser.add_argument('-workers', action='store', dest='workers', type=int, default=64,
+		help='max concurrent rpcs')
+	parser.add_argument('-db', action='store', dest='db_type', default='jsonl',
+		choices=['jsonl', 'sqlite'], help='session store')
+	parser.add_argument('-db-batch', action='store', dest='db_batch', type=int, default=64,
+		help='records per database commit')
+	parser.add_argument('-db-interval', action='store', dest='db_interval', type=float,
+		default=1.0, help='max seconds before pending records are committed')
+	parser.add_argument('-archive-codec', action='store', dest='archive_codec', default='gzip',
+		choices=['none', 'gzip', 'flac'], help='compression of archived audio')
+	parser.add_argument('-archive-quota', action='store', dest='archive_quota', type=int,
+		default=0, help='max MB of archived audio (0 = unlimited)')
+	parser.add_argument('-archive-days', action='store', dest='archive_days', type=float,
+		default=0, help='days to keep archived audio (0 = forever)')
+	parser.add_argument('-google-pool', action='store', dest='google_pool', type=int, default=4,
+		help='max pooled google clients (0 = new client per utterance)')
+	parser.add_argument('-google-streams', action='store', dest='google_streams', type=int,
+		default=50, help='concurrent streams per pooled google client')
+	parser.add_argument('-google-idle', action='store', dest='google_idle', type=float,
+		default=300, help='seconds before an idle google client is closed')
+	parser.add_argument('-hound-coalesce', action='store', dest='hound_coalesce', type=int,
+		default=100, help='ms of audio coalesced into one hound http chunk')
+	parser.add_argument('-google-codec', action='store', dest='google_codec', default='LINEAR16',
+		choices=codec.SUPPORTED['google'], help='encoding of the audio sent to google')
+	parser.add_argument('-ibm-codec', action='store', dest='ibm_codec', default='LINEAR16',
+		choices=codec.SUPPORTED['ibm'], help='encoding of the audio sent to ibm')
+	parser.add_argument('-hound-codec', action='store', dest='hound_codec', default='LINEAR16',
+		choices=codec.SUPPORTED['hound'], help='encoding of the audio sent to hound')
+	parser.add_argument('-metrics-port', action='store', dest='metrics_port', type=int,
+		default=9081, help='port of the prometheus /metrics endpoint (0 = off)')
+	parser.add_argument('-metrics-host', action='store', dest='metrics_host',
+		default='127.0.0.1', help='address the metrics endpoint listens on')
+	parser.add_argument('-fake-asrs', action='store_true', dest='fake_asrs',
+		help='use local stand-ins instead of the cloud ASRs')
+	parser.add_argument('-fake-partial', action='store', dest='fake_partial', type=int,
+		default=200, help='stand-ins: ms of audio per partial')
+	parser.add_argument('-fake-latency', action='store', dest='fake_latency', type=int,
+		default=100, help='stand-ins: ms from audio to its partial')
+	parser.add_argument('-fake-jitter', action='store', dest='fake_jitter', type=int,
+		default=50, help='stand-ins: max random ms added to each response')
+	parser.add_argument('-fake-final', action='store', dest='fake_final', type=int,
+		default=300, help='stand-ins: ms from end of audio to the final')
+	return parser.parse_args()
+
+if __name__ == '__main__':
+	serve(parse_args())
@@ -0,0 +1,25 @@
+"""STT server on a gevent event loop
+
+Same service as stt_server.py, but the standard library is monkey patched
+before anything else is imported, so the split, VAD, merge, log and backend
+I/O stages of every session run as greenlets on one event loop per process
+instead of 8-10 OS threads per session.
+"""
+
+from gevent import monkey
+monkey.patch_all()
+
+import sys
+
+try:
+	import grpc.experimental.gevent as grpc_gevent
+except ImportError:
+	# rpc completion would block the event loop from native threads
+	sys.exit('stt_server_gevent needs a grpcio with gevent support '
+		'(grpc.experimental.gevent); run stt_server.py instead')
+grpc_gevent.init_gevent()
+
+import stt_server
+
+if __name__ == '__main__':
+	stt_server.serve(stt_server.parse_args('SpeechToText service (gevent)'))
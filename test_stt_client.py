@@ -3,6 +3,7 @@
 """Test STT client implementation in GRPC"""
 
 from __future__ import print_function
+import asr.codec as codec
 import asr.utils as utils
 from proto import stt_pb2
 from grpc.beta import implementations
@@ -14,6 +15,7 @@ import pprint
 from blessings import Terminal
 import pdb
 import uuid
+import wave
 
 _TIMEOUT_SECONDS = 10
 _TIMEOUT_SECONDS_STREAM = 1000 	# timeout for streaming must be for entire stream
@@ -33,7 +35,22 @@ class Sender:
 							interim_results = self.settings['interim_results'],
 							continuous = self.settings['continuous'],
 							inactivity = self.settings['inactivity'],
-							chunksize = self.settings['chunksize']
+							chunksize = self.settings['chunksize'],
+							completion = self.settings.get('completion', 'all'),
+							min_confidence = self.settings.get('min_confidence', 0),
+							hedge_delay = self.settings.get('hedge_delay', 0),
+							interim_interval = self.settings.get('interim_interval', 0),
+							delta_transcripts = self.settings.get('delta_transcripts', False),
+							channels = self.settings.get('channels', 1),
+							silence_gating = self.settings.get('silence_gating', False),
+							gate_preroll = self.settings.get('gate_preroll', 300),
+							gate_hangover = self.settings.get('gate_hangover', 300),
+							fast_endpointing = self.settings.get('fast_endpointing', False),
+							endpoint_silence = self.settings.get('endpoint_silence', 500),
+							final_grace = self.settings.get('final_grace', 250),
+							no_speech_timeout = self.settings.get('no_speech_timeout', 10000),
+							longform = self.settings.get('longform', False),
+							segment_seconds = self.settings.get('segment_seconds', 45)
 						)
 		configResponse = service.DoConfig(configParams, _TIMEOUT_SECONDS)
 		# we create a random token which is used for streaming
@@ -61,8 +78,13 @@ class Sender:
 		## call and later, pass on the audio chunks
 		def request_stream():
 			yield stt_pb2.SpeechChunk(token=token, config=config)
-			for item in utils.generate_chunks(filename, grpc_on=True, chunkSize=chunkSize):
-				yield item
+			audio = utils.generate_chunks(filename, grpc_on=False, chunkSize=chunkSize)
+			# compress on the client when asked for (e.g. FLAC)
+			if self.settings['encoding'] != 'LINEAR16':
+				audio = codec.encode(audio, self.settings['encoding'], self.settings['sampling_rate'],
+					self.settings.get('channels', 1))
+			for content in audio:
+				yield stt_pb2.SpeechChunk(content=content)
 
 		responses = service.DoSpeechToText(request_stream(), _TIMEOUT_SECONDS_STREAM)
 
@@ -74,9 +96,13 @@ class Sender:
 			with term.location(0, rows_pos[ix]):
 				print ('############### %s ASR ################'%(asr))
 
+		transcripts = dict((asr, '') for asr in self.settings['asrs'])
 		for response in responses:
+			# rebuild the text from delta updates (prefix_length is 0 otherwise)
+			transcripts[response.asr] = utils.apply_delta(transcripts[response.asr],
+				response.prefix_length, response.transcript)
 			response_dict = {'asr': response.asr,
-							  'transcript': response.transcript,
+							  'transcript': transcripts[response.asr],
 							  'is_final': response.is_final}
 
 	  		# continuously refresh and print
@@ -105,6 +131,13 @@ if __name__ == '__main__':
 	with open('settings.json') as f:
 		settings = json.load(f)
 
+	# wav files are sent as they are; the server resamples and downmixes
+	if args.filename.endswith('.wav'):
+		audio = wave.open(args.filename)
+		settings['sampling_rate'] = audio.getframerate()
+		settings['channels'] = audio.getnchannels()
+		audio.close()
+
 	senderObj = Sender(settings)
 	service = senderObj.createService(args.ipaddr, args.port)
 	streamingconfig, token = senderObj.configService(service)
@@ -0,0 +1,60 @@
+""" Threads and responses of IBM streams against the local stand-in """
+
+import threading
+import time
+import unittest
+
+import asr.ibm as ibm
+import fakes
+
+_STREAMS = 4
+_CHUNK = '\0'*3200
+
+
+def _senders():
+	return [t for t in threading.enumerate() if t.name.startswith(ibm.SENDER_PREFIX)]
+
+
+class IbmTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		fakes.start(fakes.Schedule(partial_ms=100, latency_ms=10, jitter_ms=0, final_ms=100))
+
+	def test_one_sender_per_stream_and_partials_while_stalled(self):
+		resume = threading.Event()
+		def audio():
+			for _ in xrange(5):
+				yield _CHUNK
+			resume.wait()
+			for _ in xrange(5):
+				yield _CHUNK
+
+		results = [[] for _ in xrange(_STREAMS)]
+		def run(ix):
+			for response in ibm.worker('ibm-test-%d' % ix).stream(audio(),
+					{'continuous': False, 'encoding': 'LINEAR16'}):
+				results[ix].append(response)
+		streams = [threading.Thread(target=run, args=(ix,)) for ix in xrange(_STREAMS)]
+		for t in streams:
+			t.start()
+
+		# the clients stall after 5 chunks; the partials still arrive
+		deadline = time.time() + 10
+		while not all(results) and time.time() < deadline:
+			time.sleep(0.05)
+		self.assertTrue(all(results))
+		self.assertEqual(len(_senders()), _STREAMS)
+
+		resume.set()
+		for t in streams:
+			t.join(10)
+		for t in _senders():
+			t.join(10)
+		self.assertEqual(_senders(), [])
+		for responses in results:
+			self.assertTrue(responses[-1]['is_final'])
+
+
+if __name__ == '__main__':
+	unittest.main()
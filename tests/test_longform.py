@@ -0,0 +1,139 @@
+""" Segment rotation and stitching of asr.longform with fake backends """
+
+import struct
+import unittest
+
+import asr.longform as longform
+
+_CHUNK = 3200 # 100 ms at 16 kHz
+
+
+def _chunks(n):
+	''' Silent audio; each chunk starts with its index '''
+	for ix in xrange(n):
+		yield struct.pack('<I', ix) + '\0'*(_CHUNK - 4)
+
+
+class _Marked:
+	''' Audio marked with the pause the speaker is in, like a ring cursor:
+		a 300 ms pause at the end of every `every` chunks
+	'''
+
+	def __init__(self, n, every):
+		self.chunks = _chunks(n)
+		self.every = every
+		self.ix = 0
+		self.mark = 0
+
+	def __iter__(self):
+		return self
+
+	def next(self):
+		chunk = next(self.chunks)
+		self.ix += 1
+		self.mark = 300 if self.ix % self.every == 0 else 0
+		return chunk
+
+
+def _expected(n):
+	''' The fakes hear a word every 300 ms '''
+	return ' '.join('w%d' % (ix//3) for ix in xrange(0, n, 3))
+
+
+class _Words:
+	def __init__(self):
+		self.words = []
+
+	def hear(self, chunk):
+		ix = struct.unpack('<I', chunk[:4])[0]
+		if ix % 3 == 0:
+			self.words.append('w%d' % (ix//3))
+			return True
+		return False
+
+	def text(self):
+		return ' '.join(self.words)
+
+
+class _Fake:
+	''' Reads all the audio of its segment, like Google '''
+	stop_after = None
+	drains = False
+
+	def __init__(self, token):
+		self.token = token
+
+	def cancel(self):
+		pass
+
+	def stream(self, chunks, config=None):
+		words = _Words()
+		heard = 0
+		for chunk in chunks:
+			if words.hear(chunk):
+				yield {'transcript': words.text(), 'is_final': False}
+			heard += 1
+			if heard == self.stop_after:
+				break
+		yield {'transcript': words.text(), 'is_final': True, 'confidence': 0.5}
+		if self.drains:
+			for chunk in chunks:
+				pass
+
+
+class _EndsEarly(_Fake):
+	''' Stops reading at its end of utterance, like IBM '''
+	stop_after = 25
+
+
+class _DrainsAfterFinal(_Fake):
+	''' Sends its final early but reads on, like Hound '''
+	stop_after = 25
+	drains = True
+
+
+def _module(worker_class):
+	return type('module', (), {'worker': worker_class, '__name__': 'fake'})
+
+
+class LongformTest(unittest.TestCase):
+
+	def transcribe(self, worker_class, n, pause_every=None, **args):
+		source = _Marked(n, pause_every) if pause_every else _chunks(n)
+		w = longform.worker(_module(worker_class), 'token', 'fake', rate=16000,
+			pause=(lambda: source.mark) if pause_every else None, **args)
+		responses = list(w.stream(source, {}))
+		self.assertTrue(responses[-1]['is_final'])
+		self.assertFalse(any(r['is_final'] for r in responses[:-1]))
+		return responses[-1], len(w.workers)
+
+	def test_rotates_at_pauses(self):
+		final, segments = self.transcribe(_Fake, 125, pause_every=40, segment=3, limit=6)
+		self.assertEqual(final['transcript'], _expected(125))
+		self.assertEqual(final['confidence'], 0.5)
+		self.assertEqual(segments, 4)
+
+	def test_cut_at_limit_is_deduplicated(self):
+		final, segments = self.transcribe(_Fake, 125, segment=10, limit=3)
+		self.assertEqual(final['transcript'], _expected(125))
+		self.assertGreater(segments, 3)
+
+	def test_backend_ending_early(self):
+		final, segments = self.transcribe(_EndsEarly, 125, segment=50, limit=55)
+		self.assertEqual(final['transcript'], _expected(125))
+		self.assertGreater(segments, 3)
+
+	def test_backend_draining_after_its_final(self):
+		final, segments = self.transcribe(_DrainsAfterFinal, 125, segment=50, limit=55)
+		self.assertEqual(final['transcript'], _expected(125))
+		self.assertGreater(segments, 3)
+
+	def test_single_word_is_not_an_overlap(self):
+		self.assertEqual(longform.dedup('I said no'.split(), 'no way'.split(), 4), ['no', 'way'])
+		self.assertEqual(longform.dedup('I said no'.split(), 'said no way'.split(), 4), ['way'])
+		self.assertEqual(longform.dedup('what is the'.split(), 'hat is the weather'.split(), 4),
+			['weather'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,52 @@
+""" Back-pressure and stall detection of asr.ringbuffer """
+
+import threading
+import time
+import unittest
+
+from asr.ringbuffer import AudioRingBuffer
+
+
+def _consume(cursor, out, delay=0):
+	for chunk in cursor:
+		out.append(chunk)
+		time.sleep(delay)
+
+
+class RingBufferTest(unittest.TestCase):
+
+	def readers(self, ring, delays):
+		got = [[] for _ in delays]
+		threads = [threading.Thread(target=_consume, args=(ring.reader(), out, delay))
+			for out, delay in zip(got, delays)]
+		for t in threads:
+			t.start()
+		return got, threads
+
+	def test_slow_reader_is_waited_for(self):
+		ring = AudioRingBuffer(capacity=4, stall_timeout=1.0)
+		(fast, slow), threads = self.readers(ring, [0, 0.05])
+		for ix in xrange(40):
+			ring.write(str(ix))
+		ring.close()
+		for t in threads:
+			t.join()
+		self.assertEqual(fast, map(str, range(40)))
+		self.assertEqual(slow, map(str, range(40)))
+
+	def test_stalled_reader_is_detached(self):
+		ring = AudioRingBuffer(capacity=4, stall_timeout=0.3)
+		(fast,), threads = self.readers(ring, [0])
+		stalled = ring.reader()
+		start = time.time()
+		for ix in xrange(10):
+			ring.write(str(ix))
+		self.assertGreaterEqual(time.time() - start, 0.3)
+		self.assertTrue(stalled.detached)
+		ring.close()
+		threads[0].join()
+		self.assertEqual(fast, map(str, range(10)))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,110 @@
+""" Sessions run in-process against the local stand-in ASRs
+
+	python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import wave
+
+import fakes
+import stt_server
+from proto import stt_pb2
+
+_AUDIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+	'audio', 'whatistheweatherthere.wav')
+
+
+def _config(**fields):
+	config = dict(asrs=['google', 'hound', 'ibm'], encoding='LINEAR16', sampling_rate=16000,
+		language='en-US', max_alternatives=1, interim_results=True, chunksize=3072)
+	config.update(fields)
+	return stt_pb2.ConfigSTT(**config)
+
+
+def _requests(config, token):
+	audio = wave.open(_AUDIO)
+	yield stt_pb2.SpeechChunk(token=token, config=config)
+	while True:
+		chunk = audio.readframes(1536)
+		if not chunk:
+			break
+		yield stt_pb2.SpeechChunk(content=chunk)
+
+
+class _OpenOnly:
+	''' A primary that opens its stream with an empty partial and then
+		stays silent past the hedge delay
+	'''
+
+	def __init__(self, token):
+		pass
+
+	def cancel(self):
+		pass
+
+	def stream(self, chunks, config):
+		yield {'transcript': '', 'is_final': False}
+		time.sleep(0.6)
+		for chunk in chunks:
+			pass
+		yield {'transcript': '', 'is_final': True, 'confidence': 0}
+
+
+class SessionTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		fakes.start(fakes.Schedule(partial_ms=200, latency_ms=10, jitter_ms=0, final_ms=100))
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.paths = stt_server._DB_PATH, stt_server._AUDIO_PATH
+		stt_server._DB_PATH = os.path.join(self.dir, 'sessions')
+		stt_server._AUDIO_PATH = os.path.join(self.dir, 'audio')
+		self.listener = stt_server.Listener()
+
+	def tearDown(self):
+		self.listener.close()
+		stt_server._DB_PATH, stt_server._AUDIO_PATH = self.paths
+		shutil.rmtree(self.dir)
+
+	def run_session(self, token, **fields):
+		return list(self.listener.DoSpeechToText(_requests(_config(**fields), token), None))
+
+	def stored(self, token):
+		self.listener.persister.flush()
+		return self.listener.db.get(token)
+
+	def test_record_has_every_final(self):
+		responses = self.run_session('all-finals')
+		finals = dict((r.asr, r.transcript) for r in responses if r.is_final)
+		self.assertEqual(set(finals), set(['google', 'hound', 'ibm']))
+
+		record = self.stored('all-finals')
+		self.assertEqual(dict((r['asr'], r['transcript']) for r in record['results']), finals)
+		self.assertTrue(all(r['is_final'] for r in record['results']))
+		self.assertGreater(record['audio']['received_seconds'], 0)
+
+	def test_record_of_first_final(self):
+		responses = self.run_session('first-final', completion='first_final')
+		finals = [r.asr for r in responses if r.is_final]
+		self.assertEqual(len(finals), 1)
+		self.assertEqual([r['asr'] for r in self.stored('first-final')['results']], finals)
+
+	def test_empty_partial_does_not_cancel_the_hedge(self):
+		modules = dict(stt_server._ASR_MODULES)
+		stt_server._ASR_MODULES['google'] = type('module', (), {'worker': _OpenOnly})
+		try:
+			responses = self.run_session('hedged', hedge_delay=200)
+		finally:
+			stt_server._ASR_MODULES.update(modules)
+		finals = set(r.asr for r in responses if r.is_final)
+		self.assertEqual(finals, set(['google', 'hound', 'ibm']))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,55 @@
+""" Records of the jsonl session store across restarts """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import db.store as store
+
+_TOKEN = u'caf\xe9'
+
+
+class JsonlStoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def reopen(self, db, reindex=False):
+		db.close()
+		if reindex:
+			for name in os.listdir(self.dir):
+				if name.startswith('index'):
+					os.remove(os.path.join(self.dir, name))
+		return store.JsonlStore(self.dir)
+
+	def test_non_ascii_token(self):
+		db = store.JsonlStore(self.dir)
+		db.put({'token': _TOKEN, 'results': []})
+		db.put({'token': 'plain', 'results': []})
+		self.assertEqual(db.get(_TOKEN)['token'], _TOKEN)
+
+		for reindex in (False, True):
+			db = self.reopen(db, reindex)
+			self.assertEqual(db.get(_TOKEN)['token'], _TOKEN)
+			self.assertEqual(db.get('plain')['token'], 'plain')
+		db.close()
+
+	def test_bad_record_is_skipped(self):
+		db = store.JsonlStore(self.dir)
+		db.put({'token': 'first'})
+		db.f.write('{"no token": 1}\n[1, 2]\nnot json\n')
+		db.f.flush()
+		db.put({'token': 'second'})
+
+		db = self.reopen(db, reindex=True)
+		self.assertEqual(db.get('first')['token'], 'first')
+		self.assertEqual(db.get('second')['token'], 'second')
+		db.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
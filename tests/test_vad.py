@@ -0,0 +1,83 @@
+""" Frame decisions shared by the end-pointers and the gate of asr.vad """
+
+import os
+import unittest
+import wave
+
+import asr.vad as vad
+
+_AUDIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+	'audio', 'whatistheweatherthere.wav')
+_SILENCE = '\0'*32000 # 1 s at 16 kHz
+
+
+def _speech():
+	audio = wave.open(_AUDIO)
+	data = audio.readframes(audio.getnframes())
+	audio.close()
+	return data
+
+
+def _chunked(data, size):
+	return [data[offset:offset+size] for offset in xrange(0, len(data), size)]
+
+
+def _decisions(chunks):
+	frames = vad.Frames()
+	return [voiced for chunk in chunks for _, voiced in frames.process(chunk)]
+
+
+def _gate(data, **args):
+	frames = vad.Frames()
+	gate = vad.Gate(**args)
+	out = []
+	for chunk in _chunked(data, 3072):
+		for frame, voiced in frames.process(chunk):
+			gate.push(frame, voiced)
+		out.append(gate.take())
+	out.append(gate.flush(frames.flush()))
+	return ''.join(out), gate
+
+
+class VadTest(unittest.TestCase):
+
+	def setUp(self):
+		self.audio = _SILENCE + _speech() + _SILENCE
+
+	def test_frames_do_not_depend_on_chunking(self):
+		whole = _decisions([self.audio])
+		self.assertEqual(len(whole), len(self.audio)//320)
+		self.assertEqual(_decisions(_chunked(self.audio, 1000)), whole)
+		self.assertTrue(any(whole))
+
+	def test_gate_drops_leading_and_trailing_silence(self):
+		out, gate = _gate(self.audio)
+		self.assertLess(len(out), len(self.audio) - len(_SILENCE))
+		self.assertNotEqual(out[-len(_SILENCE):], _SILENCE)
+		self.assertEqual(gate.forwarded, len(out))
+		self.assertEqual(gate.received, len(self.audio))
+
+	def test_gate_without_reclose_keeps_trailing_silence(self):
+		out, gate = _gate(self.audio, reclose=False)
+		self.assertEqual(gate.segments, 1)
+		self.assertLess(len(out), len(self.audio) - len(_SILENCE)//2)
+		self.assertTrue(self.audio.endswith(out))
+
+	def test_endpointers_on_shared_frames(self):
+		frames = vad.Frames()
+		endpointer = vad.Endpointer(1000, no_speech=0)
+		events = []
+		for frame, voiced in frames.process(_SILENCE + _speech() + _SILENCE[:16000]):
+			event = endpointer.push(frame, voiced)
+			if event is not None:
+				events.append(event)
+		self.assertEqual(events, [vad.START_OF_SPEECH])
+		self.assertGreaterEqual(endpointer.pause_ms, 400)
+
+		fast = vad.FastEndpointer(300)
+		events = [fast.push(voiced) for _, voiced in vad.Frames().process(self.audio)]
+		self.assertEqual([e for e in events if e], [vad.START_OF_SPEECH, vad.END_OF_SPEECH])
+
+
+if __name__ == '__main__':
+	unittest.main()